@@ -0,0 +1,214 @@
+"""离线音频分析：响度（BS.1770 近似）、RMS 包络、副歌/高潮片段定位；多进程并行，结果按版本缓存
+
+用法：python analysis.py [music 目录] [缓存文件]
+"""
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.signal import lfilter
+
+ANALYSIS_VERSION = 2  # 算法变了就加一，旧缓存自动作废
+ANALYSIS_RATE = 22050
+TARGET_LUFS = -16.0
+MAX_GAIN_DB = 12.0
+PEAK_CEILING_DB = -1.0  # 提增益后峰值不超过这里，留 1 dB 余量防削波
+HOP_SECONDS = 0.5
+HOOK_SECONDS = 20
+N_BANDS = 16
+
+
+# ---------- 解码 ----------
+
+def decode_mono(path, rate=ANALYSIS_RATE):
+    from pydub import AudioSegment
+    seg = AudioSegment.from_file(path).set_channels(1).set_frame_rate(rate)
+    x = np.asarray(seg.get_array_of_samples(), dtype=np.float32)
+    return x / float(1 << (8 * seg.sample_width - 1))
+
+
+# ---------- 响度 ----------
+
+def k_weighting(rate):
+    """RBJ 公式算出任意采样率下的 K 加权两级滤波器（高架 + 高通）"""
+    A = 10 ** (4.0 / 40); w0 = 2 * np.pi * 1500 / rate; alpha = np.sin(w0) / (2 / np.sqrt(2))
+    cw, sa = np.cos(w0), 2 * np.sqrt(A) * alpha
+    shelf = ([A * ((A + 1) + (A - 1) * cw + sa), -2 * A * ((A - 1) + (A + 1) * cw), A * ((A + 1) + (A - 1) * cw - sa)],
+             [(A + 1) - (A - 1) * cw + sa, 2 * ((A - 1) - (A + 1) * cw), (A + 1) - (A - 1) * cw - sa])
+    w0 = 2 * np.pi * 38 / rate; alpha = np.sin(w0) / (2 * 0.5); cw = np.cos(w0)
+    highpass = ([(1 + cw) / 2, -(1 + cw), (1 + cw) / 2], [1 + alpha, -2 * cw, 1 - alpha])
+    return shelf, highpass
+
+
+def integrated_loudness(x, rate=ANALYSIS_RATE):
+    """400 ms 块、75% 重叠，绝对门限 -70 LUFS + 相对门限 -10 LU"""
+    for b, a in k_weighting(rate): x = lfilter(b, a, x)
+    block, hop = int(0.4 * rate), int(0.1 * rate)
+    if len(x) < block: return -70.0
+    blocks = np.lib.stride_tricks.sliding_window_view(x, block)[::hop]
+    z = np.mean(blocks * blocks, axis=1)
+    lk = -0.691 + 10 * np.log10(z + 1e-12)
+    z = z[lk > -70]
+    if len(z) == 0: return -70.0
+    rel = -0.691 + 10 * np.log10(z.mean()) - 10
+    z = z[-0.691 + 10 * np.log10(z) > rel]
+    return float(-0.691 + 10 * np.log10(z.mean())) if len(z) else -70.0
+
+
+# ---------- 包络与高潮片段 ----------
+
+def frame_features(x, rate=ANALYSIS_RATE, hop_seconds=HOP_SECONDS):
+    """每 hop 一帧：RMS(dB) 与对数频带能量（余弦相似度用）"""
+    hop = int(hop_seconds * rate)
+    n = len(x) // hop
+    if n == 0: return np.zeros(0), np.zeros((0, N_BANDS))
+    frames = x[: n * hop].reshape(n, hop)
+    rms_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    spec = np.abs(np.fft.rfft(frames * np.hanning(hop), axis=1)) ** 2
+    edges = np.unique(np.geomspace(2, spec.shape[1] - 1, N_BANDS + 1).astype(int))
+    bands = np.log1p(np.add.reduceat(spec, edges[:-1], axis=1) * 1e3)
+    return rms_db, bands
+
+
+def find_hook(rms_db, bands, hop_seconds=HOP_SECONDS, hook_seconds=HOOK_SECONDS):
+    """“最好认的一段”= 能量高 + 在全曲里反复出现（副歌）；返回起点秒数与得分"""
+    n = len(rms_db)
+    win = max(1, int(hook_seconds / hop_seconds))
+    if n <= win: return 0.0, 0.0
+    f = bands - bands.mean(axis=0)
+    f /= np.linalg.norm(f, axis=1, keepdims=True) + 1e-9
+    sim = f @ f.T
+    min_lag = int(4 / hop_seconds)  # 相隔 4 秒以上才算“重复”，排除相邻帧的自相似
+    idx = np.arange(n)
+    sim[np.abs(idx[:, None] - idx[None, :]) < min_lag] = -1
+    k = min(4, n - 1)
+    repetition = np.sort(sim, axis=1)[:, -k:].mean(axis=1)
+    z = lambda v: (v - v.mean()) / (v.std() + 1e-9)
+    score = z(rms_db) + z(repetition)
+    windowed = np.convolve(score, np.ones(win) / win, mode="valid")
+    start = int(np.argmax(windowed))
+    return start * hop_seconds, float(windowed[start])
+
+
+def analyze_file(path):
+    """单个文件的完整分析（在子进程里跑）"""
+    t0 = time.perf_counter()
+    x = decode_mono(path)
+    loudness = integrated_loudness(x)
+    peak_db = float(20 * np.log10(np.max(np.abs(x)) + 1e-9)) if len(x) else -90.0
+    gain_db = min(float(np.clip(TARGET_LUFS - loudness, -MAX_GAIN_DB, MAX_GAIN_DB)), PEAK_CEILING_DB - peak_db)
+    rms_db, bands = frame_features(x)
+    hook_start, hook_score = find_hook(rms_db, bands)
+    return {
+        "duration": round(len(x) / ANALYSIS_RATE, 2),
+        "loudness": round(loudness, 2),
+        "peak_db": round(peak_db, 2),
+        "gain_db": round(gain_db, 2),
+        "hook_start": round(hook_start, 2),
+        "hook_score": round(hook_score, 3),
+        "envelope": [round(float(v), 1) for v in rms_db],  # 每 HOP_SECONDS 一个点
+        "elapsed": round(time.perf_counter() - t0, 3),
+    }
+
+
+def _analyze_safe(path):
+    try:
+        return path, analyze_file(path), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+class AnalysisStore:
+    """分析结果缓存：键为文件名，带 size/mtime/版本，源文件不变就不重算"""
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.results = {}
+        self._lock = threading.Lock()
+        self.running = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == ANALYSIS_VERSION:
+            with self._lock: self.results = data.get("tracks", {})
+
+    def get(self, path):
+        """取某首歌的结果；源文件改过则视为没有"""
+        rec = self.results.get(os.path.basename(path))
+        if rec is None: return None
+        try:
+            st_result = os.stat(path)
+        except OSError:
+            return None
+        if rec["size"] != st_result.st_size or rec["mtime"] != st_result.st_mtime_ns: return None
+        return rec
+
+    def stale(self, paths):
+        return [p for p in paths if self.get(p) is None]
+
+    def refresh(self, paths, max_workers=None):
+        """并行分析所有过期文件，返回 (分析数, 失败数, 耗时秒)"""
+        todo = self.stale(paths)
+        t0 = time.perf_counter()
+        failed = 0
+        self.running = True
+        try:
+            if todo:
+                workers = max_workers or os.cpu_count() or 1
+                chunksize = max(1, len(todo) // (workers * 4))
+                # spawn：从多线程的 Streamlit 进程里 fork 不安全
+                with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    for path, result, err in pool.map(_analyze_safe, todo, chunksize=chunksize):
+                        if result is None:
+                            failed += 1; continue
+                        st_result = os.stat(path)
+                        result.update(size=st_result.st_size, mtime=st_result.st_mtime_ns)
+                        with self._lock: self.results[os.path.basename(path)] = result
+                self.save()
+        finally:
+            self.running = False
+        return len(todo), failed, time.perf_counter() - t0
+
+    def refresh_in_background(self, paths, music_root):
+        """另起 `python analysis.py` 子进程补算整个目录，算完重新读缓存。
+        不在本进程开进程池：streamlit run 下 __main__ 是 app.py，spawn 出的每个子进程都会把整个 app 重跑一遍"""
+        if self.running or not self.stale(paths): return None
+        self.running = True  # 先占位，避免并发重复启动
+        t = threading.Thread(target=self._refresh_subprocess, args=(music_root,), name="analysis", daemon=True)
+        t.start()
+        return t
+
+    def _refresh_subprocess(self, music_root):
+        try:
+            subprocess.run([sys.executable, os.path.abspath(__file__), music_root, self.cache_path],
+                           stdout=subprocess.DEVNULL, check=False)
+            self.load()
+        finally:
+            self.running = False
+
+    def save(self):
+        with self._lock:
+            data = {"version": ANALYSIS_VERSION, "tracks": dict(self.results)}
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        tmp = self.cache_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.cache_path)
+
+
+if __name__ == "__main__":
+    root = sys.argv[1] if len(sys.argv) > 1 else "music"
+    cache = sys.argv[2] if len(sys.argv) > 2 else os.path.join(".cache", "analysis.json")
+    files = sorted(os.path.join(root, f) for f in os.listdir(root) if f.endswith(".mp3"))
+    n, failed, secs = AnalysisStore(cache).refresh(files)
+    print(f"分析 {n} 首（失败 {failed}），共 {len(files)} 首，用时 {secs:.1f} 秒")
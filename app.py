@@ -1,11 +1,27 @@
 import streamlit as st
 import os
-import random
 import time
-import json
+import ipaddress
+import random
 import base64
+import hashlib
 import google.generativeai as genai
+import streamlit.components.v1 as components
 from audiorecorder import audiorecorder # ⚠️ 核心改变：网页录音组件
+from media_server import MediaServer
+from clips import ClipCache
+from catalog import Catalog, parse_filename, NO_ARTIST
+from prefetch import PrefetchCache, make_pool
+from rooms import RoomRegistry
+from analysis import AnalysisStore
+from sampler import SongSampler, PlayHistory
+from judge import JudgeService, GeminiBackend, StubBackend
+from voice import prepare_guess_audio
+from metrics import Metrics, NOOP
+from assets import StaticBundle
+from matches import MatchStore
+from overlays import (OVERLAY_CSS, show_overlay_message, show_countdown_overlay, render_pending_overlay,
+                      run_countdown_gate, client_timer, cancel_timer)
 
 # ================= 1. 基础配置 =================
 # 云端不需要代理设置
@@ -18,25 +34,147 @@ except:
 
 genai.configure(api_key=MY_API_KEY.strip(), transport='rest')
 
+def get_setting(name, default):
+    """优先读 Secrets，其次环境变量"""
+    try:
+        return st.secrets[name]
+    except:
+        return os.environ.get(name, default)
+
 # ⚠️ 核心改变：相对路径，适应云端
 MUSIC_ROOT = "music"
 
-AVATAR_LIBRARY = {
-    "潮酷猴哥": "https://cdn.jsdelivr.net/gh/twitter/twemoji@latest/assets/svg/1f435.svg",
-    "呆萌企鹅": "https://cdn.jsdelivr.net/gh/twitter/twemoji@latest/assets/svg/1f427.svg",
-    "霸气狮王": "https://cdn.jsdelivr.net/gh/twitter/twemoji@latest/assets/svg/1f981.svg",
-    "国宝熊猫": "https://cdn.jsdelivr.net/gh/twitter/twemoji@latest/assets/svg/1f43c.svg",
-    "粉嫩小猪": "https://cdn.jsdelivr.net/gh/twitter/twemoji@latest/assets/svg/1f437.svg",
-    "机灵狐狸": "https://cdn.jsdelivr.net/gh/twitter/twemoji@latest/assets/svg/1f98a.svg",
-    "可爱兔兔": "https://cdn.jsdelivr.net/gh/twitter/twemoji@latest/assets/svg/1f430.svg",
-    "慵懒考拉": "https://cdn.jsdelivr.net/gh/twitter/twemoji@latest/assets/svg/1f428.svg",
-    "高冷猫咪": "https://cdn.jsdelivr.net/gh/twitter/twemoji@latest/assets/svg/1f431.svg",
-    "憨厚棕熊": "https://cdn.jsdelivr.net/gh/twitter/twemoji@latest/assets/svg/1f43b.svg"
-}
+# 音频投递：stream = 本地媒体服务按 URL 流式播放；inline = 旧版 base64 内嵌
+# auto（默认）= 配了 AUDIO_BASE_URL，或页面是从本机/局域网用 http 打开的才走媒体服务；
+# 云端只暴露 Streamlit 端口且是 HTTPS，直连媒体端口既连不上又算混合内容，必须内嵌
+AUDIO_DELIVERY = get_setting("AUDIO_DELIVERY", "auto")
+AUDIO_SERVER_PORT = int(get_setting("AUDIO_SERVER_PORT", 8502))
+AUDIO_BASE_URL = get_setting("AUDIO_BASE_URL", "") # 反向代理部署时填公网地址，如 https://xxx/media
+
+# 片段模式：每轮只播 15~30 秒低码率单声道片段，流量省 10 倍以上
+CLIP_MODE = str(get_setting("CLIP_MODE", "on")).lower() not in ("off", "0", "false")
+CLIP_CACHE_DIR = get_setting("CLIP_CACHE_DIR", os.path.join(".cache", "clips"))
+CLIP_CACHE_MB = int(get_setting("CLIP_CACHE_MB", 300))
+PREFETCH_WORKERS = int(get_setting("PREFETCH_WORKERS", 2))
+ANALYSIS_CACHE = get_setting("ANALYSIS_CACHE", os.path.join(".cache", "analysis.json"))
+ANALYSIS_AUTO = str(get_setting("ANALYSIS_AUTO", "on")).lower() not in ("off", "0", "false") # 启动后后台补算新歌
+PLAY_HISTORY = get_setting("PLAY_HISTORY", os.path.join(".cache", "play_history.json"))
+HISTORY_EXCLUDE_DAYS = float(get_setting("HISTORY_EXCLUDE_DAYS", 3)) # 几天内播过的歌不再出
+CATALOG_INDEX = get_setting("CATALOG_INDEX", os.path.join(".cache", "catalog.json"))
+MATCH_DB = get_setting("MATCH_DB", os.path.join(".cache", "matches.db")) # 跨局战绩/排行榜
+
+# AI 裁判：gemini = 线上模型；stub = 本地假后端（离线调试用）
+JUDGE_BACKEND = get_setting("JUDGE_BACKEND", "gemini")
+JUDGE_WORKERS = int(get_setting("JUDGE_WORKERS", 4))
+JUDGE_TIMEOUT = float(get_setting("JUDGE_TIMEOUT", 30))
+
+# 埋点：on 时在媒体服务上开 /metrics（Prometheus 文本格式）；METRICS_TRACE 填路径则另写 JSONL 轨迹
+METRICS = str(get_setting("METRICS", "off")).lower() in ("on", "1", "true")
+METRICS_TRACE = get_setting("METRICS_TRACE", "")
+
+# 头像雪碧图/样式表生成在这里，文件名带内容哈希，由媒体服务长缓存提供（不再依赖外部 CDN）
+STATIC_DIR = os.path.join(".cache", "static")
 
 # ================= 2. 核心逻辑函数 =================
 
-def get_audio_html(file_path):
+@st.cache_resource
+def get_metrics():
+    """全进程一份指标表；关闭时返回空实现，各处埋点只多一次属性判断"""
+    if not METRICS: return NOOP
+    m = Metrics(trace_path=METRICS_TRACE or None)
+    m.describe("rerun_seconds", "script rerun wall time (runs that reached the end of the script)")
+    m.describe("reruns_total", "script reruns by exit: complete, or early via st.rerun/st.stop")
+    m.describe("payload_bytes", "size of large HTML payloads sent to the browser")
+    m.describe("judge_backend_seconds", "one model call, including upload")
+    m.describe("judge_wait_seconds", "time the script thread waited for a verdict")
+    srv = get_media_server()
+    if srv is not None: srv.add_handler("metrics", m.handle_http)
+    return m
+
+def begin_rerun():
+    """每次重跑开头调用：登记活跃会话；上一次重跑没走到脚本末尾（st.rerun/st.stop 提前结束）的记一次提前退出"""
+    m = get_metrics()
+    if not m.enabled: return None
+    if 'metrics_sid' not in st.session_state: st.session_state.metrics_sid = f"{random.getrandbits(64):016x}"
+    m.touch_session(st.session_state.metrics_sid)
+    if st.session_state.get("metrics_open_stage"): m.inc("reruns_total", exit="early", stage=st.session_state.metrics_open_stage)
+    st.session_state.metrics_open_stage = st.session_state.get("game_stage", "HOME")
+    return time.perf_counter()
+
+def end_rerun(t0):
+    if t0 is None: return
+    stage = st.session_state.metrics_open_stage; st.session_state.metrics_open_stage = None
+    m = get_metrics()
+    m.observe("rerun_seconds", time.perf_counter() - t0, stage=stage, mode=st.session_state.config['referee_mode'])
+    m.inc("reruns_total", exit="complete", stage=stage)
+
+@st.cache_resource
+def get_media_server():
+    """全进程只启动一次；端口被占用等情况返回 None，自动退回内嵌模式"""
+    srv = MediaServer(port=AUDIO_SERVER_PORT)
+    srv.mount("music", MUSIC_ROOT)
+    srv.mount("clips", CLIP_CACHE_DIR)
+    srv.mount("static", STATIC_DIR)
+    try:
+        return srv.start()
+    except OSError:
+        return None
+
+def page_host():
+    """(地址栏主机名, 是否 https)；没有请求上下文（本机脚本/测试）时主机名为空"""
+    try:
+        headers = st.context.headers
+        host = headers.get("Host", "")
+        https = headers.get("X-Forwarded-Proto", "http").lower() == "https"
+    except Exception:
+        return "", False
+    return (host[1:].split("]")[0] if host.startswith("[") else host.rsplit(":", 1)[0]), https
+
+def page_is_local():
+    """页面是从本机或局域网用 http 打开的：浏览器能直连媒体端口，也没有混合内容问题"""
+    name, https = page_host()
+    if https: return False
+    if not name: return True
+    if name == "localhost" or name.endswith(".local"): return True
+    try:
+        ip = ipaddress.ip_address(name)
+    except ValueError:
+        return False  # 域名：多半是云端或反向代理
+    return ip.is_loopback or ip.is_private
+
+def page_is_loopback():
+    """页面就开在跑服务的这台机器上，媒体端口一定连得上"""
+    name, _ = page_host()
+    if not name or name == "localhost": return True
+    try:
+        return ipaddress.ip_address(name).is_loopback
+    except ValueError:
+        return False
+
+def stream_media_server():
+    """本页可用的媒体服务；浏览器够不着时返回 None，调用方一律退回内嵌"""
+    if AUDIO_DELIVERY == "inline": return None
+    if AUDIO_DELIVERY == "auto" and not AUDIO_BASE_URL and not page_is_local(): return None
+    return get_media_server()
+
+def media_base_url(srv):
+    if AUDIO_BASE_URL: return AUDIO_BASE_URL.rstrip("/")
+    # 默认与页面同主机，换成媒体服务端口
+    try:
+        host = st.context.headers.get("Host", "localhost")
+    except Exception:
+        host = "localhost"
+    return f"http://{host.rsplit(':', 1)[0]}:{srv.port}"
+
+def audio_html(file_path, srv, base_url, start=0.0):
+    """生成播放标签；不碰 session_state，预取线程里也能调用。start>0 时用媒体片段 #t= 跳到高潮处"""
+    if srv is not None:
+        try:
+            # 只下发几百字节的地址，浏览器边下边播，重跑时命中缓存
+            url = base_url + srv.url_for(file_path) + (f"#t={start:.1f}" if start else "")
+            return f'<audio controls autoplay preload="auto" style="width: 100%;" src="{url}"></audio>'
+        except (OSError, KeyError):
+            pass
     try:
         with open(file_path, "rb") as f:
             data = f.read()
@@ -46,81 +184,203 @@ def get_audio_html(file_path):
     except Exception as e:
         return f"播放出错: {e}"
 
-def show_overlay_message(title, sub_text="", color="#FF4B4B", duration=3, icon=""):
-    placeholder = st.empty()
-    for i in range(duration * 10, 0, -1):
-        placeholder.markdown(f"""
-            <div style="position: fixed; top: 0; left: 0; width: 100%; height: 100%;
-                background: rgba(255, 255, 255, 0.98); z-index: 9999;
-                display: flex; align-items: center; justify-content: center;
-                flex-direction: column; text-align: center; animation: fadeIn 0.3s;">
-                <div style="font-size: 80px; margin-bottom: 20px;">{icon}</div>
-                <h1 style="font-size: 70px; color: {color}; margin: 0; text-shadow: 0px 4px 10px rgba(0,0,0,0.1);">{title}</h1>
-                <h2 style="color: #555; font-size: 35px; margin-top: 20px; font-weight: normal;">{sub_text}</h2>
-                <div style="margin-top: 30px; width: 200px; height: 5px; background: #eee;">
-                    <div style="width: {i* (100/(duration*10))}%; height: 100%; background: {color}; transition: width 0.1s;"></div>
-                </div>
-            </div>
-        """, unsafe_allow_html=True)
-        time.sleep(0.1)
-    placeholder.empty()
-
-def show_countdown_overlay(seconds=3, title="即将播放..."):
-    placeholder = st.empty()
-    for i in range(seconds, 0, -1):
-        placeholder.markdown(f"""
-            <div style="position: fixed; top: 0; left: 0; width: 100%; height: 100%;
-                background: rgba(255, 255, 255, 0.95); z-index: 9999;
-                display: flex; align-items: center; justify-content: center;
-                flex-direction: column;">
-                <div style="font-size: 180px; color: #FF4B4B; font-weight: bold; animation: pulse 0.8s infinite;">{i}</div>
-                <h2 style="color: #333; font-size: 40px;">{title}</h2>
-            </div>
-        """, unsafe_allow_html=True)
-        time.sleep(1)
-    placeholder.empty()
+def get_audio_html(file_path):
+    srv = stream_media_server()
+    return audio_html(file_path, srv, media_base_url(srv) if srv is not None else "")
+
+@st.cache_resource
+def get_static_bundle():
+    """头像雪碧图 + 样式表全进程只生成一次，内容不变文件名就不变"""
+    return StaticBundle(STATIC_DIR, APP_CSS)
 
-# ⚠️ 移除了 record_voice_lock_10s (本地版)，改用网页组件 audiorecorder
+def static_base_url():
+    """有媒体服务就下发短 URL 让浏览器长缓存；内嵌模式返回 None，资源直接塞进页面"""
+    srv = stream_media_server()
+    return media_base_url(srv) if srv is not None else None
 
-def ai_judge_json(audio_file_path, correct_answer, player_names):
-    """云端 AI 判决"""
-    model = genai.GenerativeModel("gemini-2.5-flash") 
-    sample = genai.upload_file(audio_file_path)
-    player_list_str = "、".join(player_names)
-    prompt = f"""任务：判定猜歌。答案：《{correct_answer}》。名单：[{player_list_str}]。
-    返回 JSON: {{"detected_text": "...", "winner_name": "...", "is_correct": true/false, "comment": "..."}}"""
+@st.cache_resource
+def get_clip_cache():
+    return ClipCache(CLIP_CACHE_DIR, max_bytes=CLIP_CACHE_MB * 1024 * 1024)
+
+@st.cache_resource
+def get_analysis_store():
+    """响度/高潮分析结果全进程共享；缺的歌由后台子进程补算，不挡游戏"""
+    store = AnalysisStore(ANALYSIS_CACHE)
+    if ANALYSIS_AUTO and os.path.exists(MUSIC_ROOT):
+        store.refresh_in_background([r.path for r in get_catalog().records.values()], MUSIC_ROOT)
+    return store
+
+def analysis_hint(song_path):
+    """(高潮起点秒数, 归一化增益 dB)；还没分析过返回 None"""
+    rec = get_analysis_store().get(song_path)
+    return (rec["hook_start"], rec["gain_db"]) if rec else None
+
+def pick_clips(songs):
+    """开赛/决胜局时为每首歌选定一段片段：分析过的歌用高潮段（第 0 段），否则随机"""
+    if not CLIP_MODE: return
+    n = get_clip_cache().clips_per_track
+    for s in songs: st.session_state.clip_picks[s] = 0 if analysis_hint(s) else random.randrange(n)
+
+def resolve_clip(song_path, clip_index, clip_cache, hint=None, metrics=NOOP):
+    """本轮实际播放的文件：优先片段，切片失败（如缺 ffmpeg）退回原曲"""
+    if clip_cache is None or clip_index is None: return song_path
     try:
-        response = model.generate_content([prompt, sample])
-        clean_text = response.text.replace("```json", "").replace("```", "").strip()
-        return json.loads(clean_text)
-    except:
-        return {"winner_name": "", "is_correct": False, "comment": "没听清", "detected_text": ""}
-
-def get_song_library(selected_eras):
-    playlist = []
-    era_map = {"80年代及以前": ["80s", "70s", "60s"], "90年代": ["90s"], "00年代": ["00s"], "10年代及以后": ["10s", "20s"]}
-    target_prefixes = []
-    for label in selected_eras: target_prefixes.extend(era_map.get(label, []))
-    
+        with metrics.timer("clip_resolve_seconds"):
+            return clip_cache.clip_path(song_path, clip_index, hint)
+    except Exception:
+        metrics.inc("clip_fallback_total")
+        return song_path
+
+def load_round_audio(song_path, clip_index, clip_cache, srv, base_url, hint=None, metrics=NOOP):
+    """预取任务：切片/转码 + 预读磁盘 + 生成播放标签"""
+    with metrics.timer("audio_prepare_seconds", delivery="stream" if srv is not None else "inline"):
+        path = resolve_clip(song_path, clip_index, clip_cache, hint, metrics)
+        if srv is not None:
+            try:
+                with open(path, "rb") as f:
+                    while f.read(1 << 20): pass  # 读进系统页缓存，浏览器来拉时不再等磁盘
+            except OSError:
+                pass
+        # 片段已从高潮处切好；播原曲时让浏览器跳到高潮起点
+        start = hint[0] if hint and path == song_path else 0.0
+        return audio_html(path, srv, base_url, start)
+
+@st.cache_resource
+def get_prefetch_pool():
+    return make_pool(PREFETCH_WORKERS)
+
+def _round_audio_job(idx):
+    song_path = st.session_state.playlist[idx]
+    clip_index = st.session_state.clip_picks.get(song_path) if CLIP_MODE else None
+    srv = stream_media_server()
+    base_url = media_base_url(srv) if srv is not None else ""
+    hint = analysis_hint(song_path)
+    key = (song_path, clip_index, base_url, hint)
+    return key, (song_path, clip_index, get_clip_cache() if CLIP_MODE else None, srv, base_url, hint, get_metrics())
+
+def prefetch_round(idx):
+    """后台准备第 idx 轮的音频（倒计时、上一轮进行中都在并行干活）"""
+    if 0 <= idx < len(st.session_state.playlist):
+        key, args = _round_audio_job(idx)
+        st.session_state.prefetch.prefetch(key, load_round_audio, *args)
+
+def get_round_audio_html(idx):
+    key, args = _round_audio_job(idx)
+    m = get_metrics()
+    if not m.enabled: return st.session_state.prefetch.get(key, load_round_audio, *args)
+    # 脚本线程真正等了多久：预取命中时应接近 0
+    with m.timer("audio_html_seconds", prefetched=str(st.session_state.prefetch.is_ready(key)).lower()):
+        html = st.session_state.prefetch.get(key, load_round_audio, *args)
+    m.observe("payload_bytes", len(html.encode("utf-8")), kind="audio")
+    return html
+
+@st.cache_resource
+def get_room_registry():
+    """房间表全进程共享，接口挂在媒体服务的 /rooms 下"""
+    registry = RoomRegistry()
+    srv = get_media_server()
+    if srv is not None: srv.add_handler("rooms", registry.handle_http)
+    return registry
+
+def current_room():
+    code = st.session_state.get("room_code")
+    return get_room_registry().get(code) if code else None
+
+def players_view():
+    """本次重跑渲染用的选手列表：房间模式下手机线程会随时增删，取一份加锁快照；改动一律走 Room 的方法"""
+    room = current_room()
+    return room.snapshot()["players"] if room is not None else st.session_state.players
+
+ROOM_UNREACHABLE = "房间需要浏览器直连媒体服务：请在局域网内用 http 打开本页，或配置 AUDIO_BASE_URL"
+
+_room_board = components.declare_component(
+    "room_board", path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "room_board"))
+
+def room_board(room, role, me=""):
+    """房间面板：选手端显示比分+抢答键；主持人端只显示状态，有人抢到时触发重跑"""
+    srv = stream_media_server()
+    if srv is None:
+        st.error(ROOM_UNREACHABLE); return None
+    return _room_board(base_url=media_base_url(srv), code=room.code, role=role, me=me,
+                       key=f"room_board_{role}", default=None)
+
+def change_score(p, delta):
+    """所有加减分都走这里；房间模式下加锁修改并推送给每台手机"""
+    room = current_room()
+    if room is not None: room.add_score(p['name'], delta)
+    else: p['score'] += delta
+
+@st.cache_resource
+def get_match_store():
+    """战绩库全进程共享，写入在后台线程批量提交"""
+    return MatchStore(MATCH_DB)
+
+def log_round(guesser, correct, delta=0):
+    """本轮的一次判定记入战绩库；guesser=None 表示跳过"""
+    if not st.session_state.get("game_id"): return
+    t0 = st.session_state.get("round_t0")
+    get_match_store().record_round(st.session_state.game_id, st.session_state.playlist[st.session_state.round_idx],
+                                   guesser, correct, st.session_state.config['referee_mode'],
+                                   (time.time() - t0) * 1000 if t0 else None, delta)
+
+def settle(p, correct):
+    """一次判定：按规则加减分并记入战绩"""
+    delta = 10 if correct else (-15 if st.session_state.config['rules'] == "答错扣分" else 0)
+    if delta: change_score(p, delta)
+    log_round(p['name'], correct, delta)
+
+# ⚠️ 移除了 record_voice_lock_10s (本地版)，改用网页组件 audiorecorder
+
+@st.cache_resource
+def get_judge_service():
+    """全进程共享：模型客户端复用，线程池限流"""
+    backend = StubBackend() if JUDGE_BACKEND == "stub" else GeminiBackend("gemini-2.5-flash")
+    return JudgeService(backend, max_workers=JUDGE_WORKERS, timeout=JUDGE_TIMEOUT, metrics=get_metrics())
+
+def ai_judge_json(audio_bytes, correct_answer, player_names, mime_type="audio/wav"):
+    """云端 AI 判决（录音在内存里，不再落盘 guess.wav，多局并发互不覆盖）；返回 (结果, 是否真有判决)"""
+    with get_metrics().timer("judge_wait_seconds", mode=st.session_state.config['referee_mode']):
+        return get_judge_service().judge(audio_bytes, correct_answer, player_names, mime_type)
+
+@st.cache_resource
+def get_catalog():
+    """曲库索引全进程共享，首次加载落盘的 JSON 再增量刷新"""
+    cat = Catalog(MUSIC_ROOT, CATALOG_INDEX)
+    with get_metrics().timer("catalog_refresh_seconds", kind="startup"):
+        cat.refresh(force=True)
+    return cat
+
+def get_song_buckets(selected_eras):
     # 云端路径检查
     if not os.path.exists(MUSIC_ROOT): return []
-    for f in os.listdir(MUSIC_ROOT):
-        if f.endswith('.mp3') and any(f.lower().startswith(prefix) for prefix in target_prefixes):
-            playlist.append(os.path.join(MUSIC_ROOT, f))
-    return playlist
+    cat = get_catalog()
+    with get_metrics().timer("catalog_refresh_seconds", kind="incremental"):
+        cat.refresh()
+    return cat.bucket_lists(selected_eras)
+
+@st.cache_resource
+def get_sampler():
+    """选歌器与播放历史全进程共享，跨局、跨会话记住谁最近播过"""
+    history = PlayHistory(PLAY_HISTORY, exclude_days=HISTORY_EXCLUDE_DAYS)
+    return SongSampler(history)
+
+def draw_songs(selected_eras, k, exclude=()):
+    sampler = get_sampler()
+    with get_metrics().timer("song_draw_seconds"):
+        return sampler.draw(get_song_buckets(selected_eras), k, exclude=exclude, weight_fn=sampler.history.recency_weight)
 
 def parse_song_info(filename):
-    name_no_ext = os.path.splitext(filename)[0]
-    parts = name_no_ext.split('_')
-    if len(parts) >= 3: return parts[1], parts[2]
-    elif len(parts) == 2: return parts[1], "暂无信息"
-    return name_no_ext, "未知"
+    rec = get_catalog().get(filename)
+    if rec is not None: return rec.title, rec.singer
+    era, title, artists = parse_filename(filename)
+    if not era: return title, "未知"
+    return title, "、".join(artists) if artists else NO_ARTIST
 
 # ================= 3. 界面样式 =================
 
 st.set_page_config(page_title="家庭猜歌王 V6.1 Cloud", page_icon="🎶", layout="wide")
 
-st.markdown("""<style>
+APP_CSS = """
 .avatar-box-container { width: 100px; height: 100px; margin: auto; border-radius: 20px; border: 3px solid #e0e0e0; padding: 10px; transition: all 0.3s ease; }
 .selected-container { border-color: #FF4B4B !important; background: #fff5f5 !important; }
 .score-card { text-align: center; padding: 10px; border: 2px solid #ddd; border-radius: 15px; background: white; margin-bottom: 5px; box-shadow: 0 2px 5px rgba(0,0,0,0.05);}
@@ -136,7 +396,13 @@ div[data-testid="stButton"] > button[kind="primary"] {
     transition: all 0.2s ease-in-out !important;
 }
 div[data-testid="stButton"] > button[kind="primary"]:hover { transform: scale(1.02); }
-</style>""", unsafe_allow_html=True)
+""" + OVERLAY_CSS
+
+# 样式表和头像都是带哈希的静态文件：每次重跑只发一行 <link> 和几个短地址
+# 局域网里媒体端口也可能被防火墙挡住；头像连不上只是裂图，样式表连不上整页走样，所以只在确定连得上时外链
+_static_base = static_base_url()
+st.markdown(get_static_bundle().css_tag(_static_base if AUDIO_BASE_URL or page_is_loopback() else None), unsafe_allow_html=True)
+AVATAR_LIBRARY = get_static_bundle().avatar_urls(_static_base)
 
 # ================= 4. 状态逻辑 =================
 
@@ -146,6 +412,8 @@ if 'config' not in st.session_state:
     st.session_state.config = {"mode": "抢答赛", "rules": "答错扣分", "rounds": 10, "eras": ["90年代"], "referee_mode": "手动裁判"}
 
 if 'playlist' not in st.session_state: st.session_state.playlist = []
+if 'clip_picks' not in st.session_state: st.session_state.clip_picks = {}
+if 'prefetch' not in st.session_state: st.session_state.prefetch = PrefetchCache(get_prefetch_pool(), capacity=3)
 if 'round_idx' not in st.session_state: st.session_state.round_idx = 0
 if 'round_finished' not in st.session_state: st.session_state.round_finished = False
 if 'temp_avatar_key' not in st.session_state: st.session_state.temp_avatar_key = list(AVATAR_LIBRARY.keys())[0]
@@ -154,6 +422,29 @@ if 'temp_avatar_key' not in st.session_state: st.session_state.temp_avatar_key =
 if 'manual_step' not in st.session_state: st.session_state.manual_step = "IDLE" 
 if 'current_guesser' not in st.session_state: st.session_state.current_guesser = None
 
+_rerun_t0 = begin_rerun()
+
+# 浏览器端遮罩/倒计时（不占用脚本线程）
+render_pending_overlay()
+run_countdown_gate()
+
+# --- 房间选手端：手机上只显示比分和抢答键，比分靠服务端推送 ---
+if st.session_state.get("room_role") == "player":
+    room = current_room()
+    me = st.session_state.get("room_me", "")
+    st.title("📱 家庭猜歌王 - 选手端")
+    if room is None or room.closed: st.error("房间已关闭")
+    else:
+        st.caption(f"房间 {room.code} · 我是 {me}")
+        room_board(room, "player", me)
+    if st.button("🚪 离开房间", use_container_width=True):
+        if room is not None: room.leave(me)
+        st.session_state.room_code = None; st.session_state.room_role = None; st.rerun()
+    st.stop()
+
+if st.session_state.get("room_role") == "host" and current_room() is not None:
+    current_room().sync(st.session_state.game_stage, st.session_state.round_idx, len(st.session_state.playlist))
+
 # --- 阶段一：主页 ---
 if st.session_state.game_stage == "HOME":
     st.title("🎶 家庭猜歌王 - Web版")
@@ -176,8 +467,9 @@ if st.session_state.game_stage == "HOME":
             name = st.text_input("新增昵称", key="input_nm")
             st.markdown(f'<div style="text-align:center"><img src="{AVATAR_LIBRARY[st.session_state.temp_avatar_key]}" class="avatar-box-container selected-container"></div>', unsafe_allow_html=True)
             if st.button("🚀 加入比赛", use_container_width=True, key="join_btn"):
-                if name and not any(p['name']==name for p in st.session_state.players):
-                    st.session_state.players.append({"name": name, "avatar": AVATAR_LIBRARY[st.session_state.temp_avatar_key], "score": 0})
+                if name and not any(p['name']==name for p in players_view()):
+                    if current_room() is not None: current_room().join(name, AVATAR_LIBRARY[st.session_state.temp_avatar_key])
+                    else: st.session_state.players.append({"name": name, "avatar": AVATAR_LIBRARY[st.session_state.temp_avatar_key], "score": 0})
                     st.rerun()
         with cr:
             st.write("点击更换形象：")
@@ -188,13 +480,56 @@ if st.session_state.game_stage == "HOME":
                     if st.button(k, key=f"ab_{i}", use_container_width=True): 
                         st.session_state.temp_avatar_key = k; st.rerun()
 
-    if st.session_state.players:
+    with st.container(border=True):
+        st.subheader("📱 多设备房间")
+        room = current_room()
+        if room is None:
+            rc1, rc2 = st.columns(2)
+            with rc1:
+                st.caption("本机当主持人（放歌、判分），家人用自己的手机加入抢答")
+                if st.button("🏠 创建房间", use_container_width=True, key="room_create"):
+                    if stream_media_server() is None: st.error(ROOM_UNREACHABLE)
+                    else:
+                        room = get_room_registry().create(st.session_state.players)
+                        st.session_state.room_code = room.code; st.session_state.room_role = "host"; st.rerun()
+            with rc2:
+                join_code = st.text_input("房间号", key="room_code_input", max_chars=4)
+                if st.button("📲 用上面的昵称和形象加入", use_container_width=True, key="room_join"):
+                    room = get_room_registry().get(join_code)
+                    if room is None or room.closed: st.error("房间不存在")
+                    elif not name: st.error("请先填写昵称")
+                    else:
+                        room.join(name, AVATAR_LIBRARY[st.session_state.temp_avatar_key])
+                        st.session_state.room_code = room.code; st.session_state.room_role = "player"
+                        st.session_state.room_me = name; st.rerun()
+        else:
+            st.success(f"房间号：**{room.code}** —— 家人在手机上打开本页，输入房间号即可加入")
+            room_board(room, "host")
+            if st.button("关闭房间", key="room_close"):
+                get_room_registry().close(room.code)
+                st.session_state.room_code = None; st.session_state.room_role = None; st.rerun()
+
+    with st.expander("🏆 历史排行榜", expanded=False):
+        board = get_match_store().leaderboard(10)
+        if not board: st.caption("还没有完整打完的对局")
+        else:
+            st.dataframe([{"选手": r["name"], "冠军": r["wins"], "场次": r["games"], "总分": r["points"],
+                           "正确率": f"{r['accuracy']:.0%}" if r["accuracy"] is not None else "-"} for r in board],
+                         hide_index=True, use_container_width=True)
+            hard = get_match_store().hardest_songs(5)
+            if hard: st.caption("最难猜：" + "、".join(f"《{parse_song_info(h['song'])[0]}》{h['correct']}/{h['plays']}" for h in hard))
+
+    lineup = players_view()
+    if lineup:
         st.write("### 🎮 参赛阵容 (已保存)")
         pc = st.columns(6)
-        for i, p in enumerate(st.session_state.players):
+        for i, p in enumerate(lineup):
             with pc[i]:
                 st.markdown(f'<div class="score-card"><img src="{p["avatar"]}" style="width:40px;"><div>{p["name"]}</div></div>', unsafe_allow_html=True)
-                if st.button("退出", key=f"q_{i}"): st.session_state.players.pop(i); st.rerun()
+                if st.button("退出", key=f"q_{i}"):
+                    if current_room() is not None: current_room().leave(p['name'])
+                    else: st.session_state.players.pop(i)
+                    st.rerun()
         if st.button("🏁 配置完成，去开赛", use_container_width=True, type="primary"): 
             st.session_state.game_stage = "RULES"; st.rerun()
 
@@ -209,12 +544,18 @@ elif st.session_state.game_stage == "RULES":
             st.session_state.game_stage = "HOME"; st.rerun()
     with c2:
         if st.button("🎮 即刻开赛！", use_container_width=True, type="primary"):
-            songs = get_song_library(st.session_state.config['eras'])
+            songs = draw_songs(st.session_state.config['eras'], st.session_state.config['rounds'])
             if not songs: st.error("⚠️ 没歌了！请检查 music 文件夹")
             else:
-                random.shuffle(songs); st.session_state.playlist = songs[:st.session_state.config['rounds']]
+                st.session_state.playlist = songs; st.session_state.history_idx = -1
+                st.session_state.game_id = get_match_store().start_game(st.session_state.config['referee_mode'], st.session_state.config['rules'],
+                                                                        len(songs), players_view())
+                st.session_state.clip_picks = {}; pick_clips(st.session_state.playlist)
+                st.session_state.prefetch.clear(); prefetch_round(0) # 倒计时期间准备第一轮
                 st.session_state.round_idx = 0; st.session_state.round_finished = False; 
-                for p in st.session_state.players: p['score'] = 0
+                if current_room() is not None: current_room().reset_scores()
+                else:
+                    for p in st.session_state.players: p['score'] = 0
                 show_countdown_overlay(3); st.session_state.game_stage = "PLAYING"; st.rerun()
 
 # --- 阶段三：比赛现场 ---
@@ -224,10 +565,11 @@ elif st.session_state.game_stage == "PLAYING":
     with col_h: 
         if st.button("🏠 返回主页", key="back_home"): st.session_state.game_stage = "HOME"; st.rerun()
 
-    scols = st.columns(len(st.session_state.players))
-    scores = [p['score'] for p in st.session_state.players]
+    players = players_view()
+    scols = st.columns(len(players))
+    scores = [p['score'] for p in players]
     high_val = max(scores) if scores else 0
-    for i, p in enumerate(st.session_state.players):
+    for i, p in enumerate(players):
         with scols[i]:
             style = "border: 3px solid #FF4B4B;" if p['score'] == high_val and (high_val != 0 or st.session_state.round_idx > 0) else ""
             st.markdown(f'<div class="score-card" style="{style}"><img src="{p["avatar"]}" style="width:40px;"><div>{p["name"]}</div><div class="score-num">{p["score"]}</div></div>', unsafe_allow_html=True)
@@ -235,12 +577,16 @@ elif st.session_state.game_stage == "PLAYING":
     if st.session_state.round_idx < len(st.session_state.playlist):
         song_path = st.session_state.playlist[st.session_state.round_idx]
         true_name, true_singer = parse_song_info(os.path.basename(song_path))
+        prefetch_round(st.session_state.round_idx + 1) # 本轮进行中就准备下一轮
+        if st.session_state.get("history_idx", -1) < st.session_state.round_idx:
+            get_sampler().history.record([song_path]); st.session_state.history_idx = st.session_state.round_idx
+            st.session_state.round_t0 = time.time() # 作答用时从本轮第一次出现算起
         st.subheader(f"第 {st.session_state.round_idx + 1} 轮 / 共 {len(st.session_state.playlist)} 轮")
         
         if not st.session_state.round_finished:
             audio_area = st.empty()
             if st.session_state.manual_step == "IDLE":
-                audio_area.markdown(get_audio_html(song_path), unsafe_allow_html=True)
+                audio_area.markdown(get_round_audio_html(st.session_state.round_idx), unsafe_allow_html=True)
             
             # --- AI 裁判逻辑 (云端修改版) ---
             if st.session_state.config['referee_mode'] == "AI裁判":
@@ -251,50 +597,81 @@ elif st.session_state.game_stage == "PLAYING":
                 audio = audiorecorder("🎤 开始抢答", "⏹️ 结束录音")
                 
                 if len(audio) > 0: # 检测到录音
-                    audio.export("guess.wav", format="wav") # 保存
                     audio_area.empty() # 停止音乐
-                    
-                    with st.spinner("AI 云端分析中..."):
-                        res = ai_judge_json("guess.wav", true_name, [p['name'] for p in st.session_state.players])
-                    
-                    if res['winner_name'] and res['is_correct']:
-                        for p in st.session_state.players:
-                            if p['name'] == res['winner_name']: p['score'] += 10
-                        show_overlay_message(f"🎉 {res['winner_name']} 答对", f"识别：{res['detected_text']}", color="#28a745", icon="✅")
-                        st.session_state.round_finished = True; st.rerun()
+                    # 本地先做 VAD：去静音、单声道 16k、Opus 编码，没说话直接拒绝，不走网络
+                    # 组件每次重跑都返回同一段录音：按原始采样记住处理结果，不重复编码；Ogg 流序号是随机的，重编码字节会变，判决缓存键就对不上了
+                    rec_key = hashlib.sha1(audio.raw_data).hexdigest()
+                    if st.session_state.get("prepared_audio", (None, None))[0] != rec_key:
+                        prepared = prepare_guess_audio(audio)
+                        st.session_state.prepared_audio = (rec_key, prepared)
+                        get_metrics().observe("voice_prep_seconds", sum(prepared.timings.values()) / 1000)
+                        get_metrics().observe("payload_bytes", len(prepared.data), kind="voice_upload")
+                        st.session_state.audio_prep_stats = {
+                            "原始(KB)": round(prepared.original_bytes / 1024, 1), "上传(KB)": round(len(prepared.data) / 1024, 1),
+                            "格式": prepared.mime_type, "原时长(s)": round(prepared.duration, 2), "语音(s)": round(prepared.speech_duration, 2),
+                            **{f"{k}(ms)": round(v, 2) for k, v in prepared.timings.items()}}
+                    prepared = st.session_state.prepared_audio[1]
+                    if not prepared.has_speech:
+                        st.warning("🤫 没听到声音，请重新录音")
                     else:
-                        if st.session_state.config['rules'] == "答错扣分" and res['winner_name']:
-                            for p in st.session_state.players:
-                                if p['name'] == res['winner_name']: p['score'] -= 15
-                        show_overlay_message("❌ 判定错误", f"识别：{res['detected_text']}", color="#FF4B4B", icon="🚫")
-                        # ⚠️ 注意：云端版这里不自动 rerun，否则录音组件会无限循环提交
-                        # 用户需要手动点击“重试”或“跳过”
+                        # 同一段录音在重跑时会被再次提交：结果走缓存，分数也只结算一次
+                        audio_key = JudgeService.audio_key(prepared.data, true_name, [p['name'] for p in players])
+                        first_time = st.session_state.get("last_judged_audio") != audio_key
+                        with st.spinner("AI 云端分析中..."):
+                            res, judged = ai_judge_json(prepared.data, true_name, [p['name'] for p in players], prepared.mime_type)
+                        # 超时/失败不算判过：同一段录音再点一次会重试，或拿到迟到的判决再结算
+                        if judged: st.session_state.last_judged_audio = audio_key
+
+                        if not judged:
+                            st.warning("📡 AI 暂时没有给出结果，请点“再听一遍”重试，或重新录音")
+                        elif not first_time:
+                            st.caption(f"上次识别：{res['detected_text']}（如需再答请重新录音）")
+                        elif res['winner_name'] and res['is_correct']:
+                            for p in players:
+                                if p['name'] == res['winner_name']: settle(p, True)
+                            show_overlay_message(f"🎉 {res['winner_name']} 答对", f"识别：{res['detected_text']}", color="#28a745", icon="✅")
+                            st.session_state.round_finished = True; st.rerun()
+                        else:
+                            for p in players:
+                                if p['name'] == res['winner_name']: settle(p, False)
+                            show_overlay_message("❌ 判定错误", f"识别：{res['detected_text']}", color="#FF4B4B", icon="🚫")
+                            # ⚠️ 注意：云端版这里不自动 rerun，否则录音组件会无限循环提交
+                            # 用户需要手动点击“重试”或“跳过”
+                if st.session_state.get("audio_prep_stats"):
+                    with st.expander("🔧 录音处理统计", expanded=False): st.json(st.session_state.audio_prep_stats)
 
             # --- 手动裁判逻辑 (保持 V6.1 逻辑) ---
             else:
                 if st.session_state.manual_step == "IDLE":
                     st.markdown("<br>", unsafe_allow_html=True)
+                    room = current_room()
+                    if room is not None:
+                        # 房间模式：手机抢答由服务端裁定先后，抢到的人直接进入判定
+                        room.ensure_buzzer_open(st.session_state.round_idx)
+                        room_board(room, "host")
+                        winner = room.take_buzz_winner()
+                        if winner is not None:
+                            st.session_state.current_guesser = winner; cancel_timer("judge")
+                            st.session_state.manual_step = "JUDGE"; st.rerun()
                     if st.button("🎤 抢答开始", type="primary", use_container_width=True):
-                        st.session_state.manual_step = "SELECT_PLAYER"; st.rerun()
+                        if room is not None: room.close_buzzer()  # 主持人改为现场点人，别让手机上迟到的抢答在判定后又插进来
+                        cancel_timer("select"); st.session_state.manual_step = "SELECT_PLAYER"; st.rerun()
                 
                 elif st.session_state.manual_step == "SELECT_PLAYER":
                     audio_area.empty()
                     st.warning("⏱️ 请确认抢答者身份！")
                     sc1, sc2 = st.columns([4, 1])
-                    with sc2: countdown_holder = st.empty()
                     with sc1:
-                        cols = st.columns(len(st.session_state.players))
-                        for i, p in enumerate(st.session_state.players):
+                        cols = st.columns(len(players))
+                        for i, p in enumerate(players):
                             with cols[i]:
-                                st.image(p['avatar'], width=60)
+                                st.markdown(f'<img src="{p["avatar"]}" style="width:60px;">', unsafe_allow_html=True)
                                 if st.button(p['name'], key=f"sel_{i}", use_container_width=True):
-                                    st.session_state.current_guesser = p
+                                    st.session_state.current_guesser = p; cancel_timer("select"); cancel_timer("judge")
                                     st.session_state.manual_step = "JUDGE"; st.rerun()
-                    for s in range(50, 0, -1):
-                        countdown_holder.markdown(f"<h1 style='color:red; text-align:right;'>{s/10:.1f}</h1>", unsafe_allow_html=True)
-                        time.sleep(0.1)
-                        if st.session_state.manual_step != "SELECT_PLAYER": break
-                    else: st.session_state.manual_step = "IDLE"; st.rerun()
+                    with sc2:
+                        if client_timer("select", 5, style="number"):
+                            st.session_state.manual_step = "IDLE"; st.rerun()
 
                 elif st.session_state.manual_step == "JUDGE":
                     p = st.session_state.current_guesser
@@ -304,23 +681,21 @@ elif st.session_state.game_stage == "PLAYING":
                             st.write(f"正确答案是：**《{true_name}》**")
                             st.write(f"演唱歌手：**{true_singer}**")
                     st.info("请在20秒内决定是否给分：")
-                    countdown_bar = st.progress(1.0)
+                    expired = client_timer("judge", 20, style="bar")
                     c1, c2 = st.columns(2)
                     with c1:
                         if st.button("✅ 判定正确 (+10)", use_container_width=True):
-                            p['score'] += 10
+                            settle(p, True); cancel_timer("judge")
                             show_overlay_message(f"🎉 {p['name']} 正确！", f"答案是《{true_name}》", color="#28a745", icon="✅")
                             st.session_state.manual_step = "IDLE"; st.session_state.round_finished = True; st.rerun()
                     with c2:
                         if st.button("❌ 判定错误 (-15)", use_container_width=True):
-                            if st.session_state.config['rules'] == "答错扣分": p['score'] -= 15
+                            settle(p, False); cancel_timer("judge")
                             show_overlay_message(f"🚫 {p['name']} 错误！", f"正确答案是《{true_name}》", color="#FF4B4B", icon="🚫")
                             st.session_state.manual_step = "IDLE"; st.rerun()
-                    for s in range(200, 0, -1):
-                        countdown_bar.progress(s/200); time.sleep(0.1)
-                        if st.session_state.manual_step != "JUDGE": break
-                    else:
-                        if st.session_state.config['rules'] == "答错扣分": p['score'] -= 15
+                    # 浏览器计时器到点只回报一次，超时扣分只执行一次
+                    if expired:
+                        settle(p, False)
                         show_overlay_message("⏰ 超时扣分", f"由于没有及时操作", color="#FF4B4B", icon="⌛"); st.session_state.manual_step = "IDLE"; st.rerun()
 
             # 通用功能
@@ -331,25 +706,34 @@ elif st.session_state.game_stage == "PLAYING":
             with c3:
                 if st.button("🔄 再听一遍", use_container_width=True): st.rerun()
             with c4:
-                if st.button("⏭️ 跳过", use_container_width=True): st.session_state.round_finished = True; st.rerun()
+                if st.button("⏭️ 跳过", use_container_width=True):
+                    log_round(None, None); st.session_state.round_finished = True; st.rerun()
         else:
+            if current_room() is not None: current_room().close_buzzer()
             st.success(f"本轮答案：《{true_name}》 (歌手：{true_singer})")
             if st.button("👉 下一题", type="primary", use_container_width=True):
                 show_countdown_overlay(3); st.session_state.round_idx += 1; st.session_state.round_finished = False; st.rerun()
     else:
-        high_score = max([p['score'] for p in st.session_state.players])
-        winners = [p for p in st.session_state.players if p['score'] == high_score]
+        high_score = max([p['score'] for p in players])
+        winners = [p for p in players if p['score'] == high_score]
         if len(winners) > 1:
             st.warning(f"⚖️ 平局！最高分 ({high_score}) 并列人数：{len(winners)}。")
             if st.button("🔥 开启决胜局", type="primary", use_container_width=True):
-                all_s = get_song_library(st.session_state.config['eras'])
-                rem = [s for s in all_s if s not in st.session_state.playlist]
-                if rem:
-                    st.session_state.playlist.append(random.choice(rem)); st.session_state.round_finished = False
+                # 从剩余曲目里常数时间补一首，不再逐首比对整张歌单
+                pick = get_sampler().draw_one(get_song_buckets(st.session_state.config['eras']), exclude=set(st.session_state.playlist))
+                if pick:
+                    st.session_state.playlist.append(pick); pick_clips(st.session_state.playlist[-1:])
+                    prefetch_round(len(st.session_state.playlist) - 1)
+                    st.session_state.round_finished = False
                     show_countdown_overlay(3, title="⚔️ 巅峰对决！"); st.rerun()
                 else: st.error("没歌了！")
         else:
             st.balloons(); win = winners[0]
+            if st.session_state.get("game_id"):
+                get_match_store().finish_game(st.session_state.game_id, [(p['name'], p['score']) for p in players], win['name'])
+                st.session_state.game_id = None # 一局只结算一次
             st.markdown(f"<div style='text-align:center; padding:40px; background:#fffbe6; border-radius:20px;'><h1>👑 冠军：{win['name']}</h1><h2>总分：{win['score']}</h2><img src='{win['avatar']}' style='width:120px;'></div>", unsafe_allow_html=True)
             if st.button("🏠 返回主页 (保存配置)", use_container_width=True, key="home_final"): 
-                st.session_state.game_stage = "HOME"; st.rerun()
\ No newline at end of file
+                st.session_state.game_stage = "HOME"; st.rerun()
+
+end_rerun(_rerun_t0)
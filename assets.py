@@ -0,0 +1,125 @@
+"""静态资源：头像本地化并拼成一张 SVG 雪碧图，全局样式打成一个 CSS；文件名带内容哈希，交给媒体服务长缓存
+头像 SVG 放在 assets/avatars/；本地缺的那几个仍指向固定版本的 Twemoji CDN，图和以前一样，只是多一次外网请求
+
+用法：python assets.py fetch   # 联网一次，把缺的头像 SVG 下载到 assets/avatars/（之后提交进仓库即可完全离线）
+"""
+import os
+import re
+import sys
+import base64
+import hashlib
+import urllib.request
+
+# 图形来自 Twemoji（CC-BY 4.0），固定版本，避免 @latest 悄悄变样
+TWEMOJI_BASE = "https://cdn.jsdelivr.net/gh/twitter/twemoji@v14.0.2/assets/svg/"
+AVATAR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "avatars")
+ICON_SIZE = 36  # twemoji 的 viewBox 边长
+
+AVATARS = {  # 名字 -> twemoji 码点
+    "潮酷猴哥": "1f435",
+    "呆萌企鹅": "1f427",
+    "霸气狮王": "1f981",
+    "国宝熊猫": "1f43c",
+    "粉嫩小猪": "1f437",
+    "机灵狐狸": "1f98a",
+    "可爱兔兔": "1f430",
+    "慵懒考拉": "1f428",
+    "高冷猫咪": "1f431",
+    "憨厚棕熊": "1f43b",
+}
+
+
+def fetch_avatars(dest=AVATAR_DIR, base=TWEMOJI_BASE, timeout=10):
+    """下载缺的头像 SVG，返回新下载的个数"""
+    os.makedirs(dest, exist_ok=True)
+    n = 0
+    for code in AVATARS.values():
+        target = icon_path(code, dest)
+        if os.path.exists(target): continue
+        with urllib.request.urlopen(base + f"{code}.svg", timeout=timeout) as resp:
+            data = resp.read()
+        with open(target + ".part", "wb") as f:
+            f.write(data)
+        os.replace(target + ".part", target)
+        n += 1
+    return n
+
+
+def icon_path(code, src_dir=AVATAR_DIR):
+    return os.path.join(src_dir, f"{code}.svg")
+
+
+def cdn_url(code):
+    return TWEMOJI_BASE + f"{code}.svg"
+
+
+def icon_body(code, src_dir=AVATAR_DIR):
+    """单个头像的 SVG 内部元素（不含外层 <svg>）；本地没有就画 emoji 字形"""
+    try:
+        with open(icon_path(code, src_dir), "r", encoding="utf-8") as f:
+            m = re.search(r"<svg[^>]*>(.*)</svg>", f.read(), re.S)
+        if m: return m.group(1).strip()
+    except OSError:
+        pass
+    return (f'<text x="{ICON_SIZE // 2}" y="{ICON_SIZE - 6}" font-size="{ICON_SIZE - 6}" '
+            f'text-anchor="middle">&#x{code};</text>')
+
+
+def icon_data_uri(code, src_dir=AVATAR_DIR):
+    """单个头像的 data URI（没有媒体服务时用）"""
+    svg = f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {ICON_SIZE} {ICON_SIZE}">{icon_body(code, src_dir)}</svg>'
+    return "data:image/svg+xml;base64," + base64.b64encode(svg.encode("utf-8")).decode()
+
+
+def build_sprite(src_dir=AVATAR_DIR):
+    """所有头像竖排进一张 SVG，每个配一个 <view>；<img src="sprite.svg#a1f435"> 就只显示那一格"""
+    parts, views = [], []
+    for i, code in enumerate(AVATARS.values()):
+        y = i * ICON_SIZE
+        views.append(f'<view id="a{code}" viewBox="0 {y} {ICON_SIZE} {ICON_SIZE}"/>')
+        parts.append(f'<g transform="translate(0 {y})">{icon_body(code, src_dir)}</g>')
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {ICON_SIZE} {ICON_SIZE * len(AVATARS)}">'
+            + "".join(views) + "".join(parts) + "</svg>")
+
+
+def write_hashed(out_dir, stem, ext, data):
+    """写成 stem.<内容哈希>.ext；同内容已存在就不动。返回文件名"""
+    name = f"{stem}.{hashlib.sha1(data).hexdigest()[:12]}.{ext}"
+    target = os.path.join(out_dir, name)
+    if not os.path.exists(target):
+        os.makedirs(out_dir, exist_ok=True)
+        with open(target + ".part", "wb") as f:
+            f.write(data)
+        os.replace(target + ".part", target)  # 多进程同时启动也不会读到半截文件
+    return name
+
+
+class StaticBundle:
+    """启动时生成一次：头像雪碧图 + 样式表。有媒体服务时只下发短 URL，否则退回内嵌；本地没有的头像用 CDN 地址"""
+
+    def __init__(self, out_dir, css, src_dir=AVATAR_DIR, prefix="static"):
+        self.prefix = prefix
+        self.css = css
+        self.sprite_name = write_hashed(out_dir, "avatars", "svg", build_sprite(src_dir).encode("utf-8"))
+        self.css_name = write_hashed(out_dir, "app", "css", ('@charset "utf-8";\n' + css).encode("utf-8"))
+        self._missing = {code for code in AVATARS.values() if not os.path.exists(icon_path(code, src_dir))}
+        self._inline = {name: cdn_url(code) if code in self._missing else icon_data_uri(code, src_dir)
+                        for name, code in AVATARS.items()}
+
+    def avatar_urls(self, base_url=None):
+        """名字 -> 头像地址；同一张雪碧图，浏览器只请求一次"""
+        if base_url is None: return dict(self._inline)
+        return {name: cdn_url(code) if code in self._missing else f"{base_url}/{self.prefix}/{self.sprite_name}#a{code}"
+                for name, code in AVATARS.items()}
+
+    def css_tag(self, base_url=None):
+        """每次重跑只多一行 <link>，样式表本身走浏览器缓存"""
+        if base_url is None: return f"<style>{self.css}</style>"
+        return f'<link rel="stylesheet" href="{base_url}/{self.prefix}/{self.css_name}">'
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["fetch"]:
+        print(f"下载 {fetch_avatars()} 个头像到 {AVATAR_DIR}")
+    else:
+        print(__doc__)
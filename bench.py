@@ -0,0 +1,242 @@
+"""无界面压测：用 Streamlit AppTest 把 app.py 从主页一路打到冠军页，统计每次重跑的耗时/页面字节/内存与多会话吞吐
+
+用法：python bench.py [--rounds 3|5|10|15|20] [--sessions 4] [--out bench_results.json]
+裁判用本地假后端（JUDGE_BACKEND=stub），录音组件换成假录音，全程不联网。
+"""
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from assets import icon_data_uri
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+
+# ---------- 假录音组件 ----------
+
+class FakeSegment:
+    """模仿 pydub.AudioSegment 里 app 用到的那几个属性"""
+
+    def __init__(self, samples=None, frame_rate=44100):
+        self.samples = samples if samples is not None else np.zeros(0, dtype=np.int16)
+        self.frame_rate = frame_rate
+        self.channels = 1
+        self.sample_width = 2
+
+    def __len__(self):
+        return int(len(self.samples) * 1000 / self.frame_rate)
+
+    def get_array_of_samples(self):
+        return self.samples
+
+    @property
+    def raw_data(self):
+        return self.samples.tobytes()
+
+
+def fake_voice(seed, seconds=2.0, rate=44100):
+    """静音-有声-静音，每轮频率不同，避免命中判决缓存"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(rate * seconds)) / rate
+    x = rng.normal(0, 30, len(t))
+    voiced = (t > 0.5) & (t < seconds - 0.5)
+    x[voiced] += 6000 * np.sin(2 * np.pi * (180 + 7 * seed) * t[voiced])
+    return FakeSegment(x.astype(np.int16), rate)
+
+
+_recordings = types.SimpleNamespace(current=None)  # AppTest 在自己的线程里跑脚本，不能用 threading.local
+
+
+def install_fake_recorder():
+    mod = types.ModuleType("audiorecorder")
+
+    def audiorecorder(*args, **kwargs):
+        return _recordings.current or FakeSegment()
+
+    mod.audiorecorder = audiorecorder
+    sys.modules["audiorecorder"] = mod
+
+
+# ---------- 计量 ----------
+
+def tree_bytes(node):
+    """把本次重跑生成的所有元素 protobuf 大小加起来，近似下发给浏览器的字节数"""
+    total = 0
+    proto = getattr(node, "proto", None)
+    if proto is not None and hasattr(proto, "ByteSize"): total += proto.ByteSize()
+    for child in getattr(node, "children", {}).values(): total += tree_bytes(child)
+    return total
+
+
+def summarize(values):
+    if not values: return {}
+    arr = np.asarray(values, dtype=float)
+    return {"n": len(arr), "mean": round(float(arr.mean()), 3), "p50": round(float(np.percentile(arr, 50)), 3),
+            "p95": round(float(np.percentile(arr, 95)), 3), "max": round(float(arr.max()), 3)}
+
+
+class GameDriver:
+    """一个模拟会话：按钮按 label 找，遮罩/倒计时直接在 session_state 里跳过"""
+
+    def __init__(self, referee_mode, rounds, timeout=60, max_tiebreaks=2):
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.at.session_state["players"] = [{"name": n, "avatar": icon_data_uri("1f435"), "score": 0} for n in ("爸爸", "妈妈", "宝宝")]
+        self.at.session_state["config"] = {"mode": "抢答赛", "rules": "答错扣分", "rounds": rounds,
+                                           "eras": ["80年代及以前", "90年代", "00年代", "10年代及以后"], "referee_mode": referee_mode}
+        self.max_tiebreaks = max_tiebreaks  # 假裁判一直判错会无限平局，决胜局限次
+        self.reruns = []  # [(阶段, 毫秒, 字节)]
+
+    def run(self, label="run"):
+        stage = self.at.session_state["game_stage"] if "game_stage" in self.at.session_state else "INIT"
+        t0 = time.perf_counter()
+        self.at.run()
+        ms = (time.perf_counter() - t0) * 1000
+        if self.at.exception: raise RuntimeError(f"{label}: {self.at.exception[0].message}")
+        self.reruns.append((stage, ms, tree_bytes(self.at._tree)))
+
+    def click(self, label=None, key=None):
+        for b in self.at.button:
+            if (key is not None and b.key == key) or (label is not None and b.label == label):
+                b.click(); self.run(label or key); return True
+        return False
+
+    def skip_countdown(self):
+        if self.at.session_state["countdown"] if "countdown" in self.at.session_state else None:
+            self.at.session_state["countdown"] = None
+            self.run("countdown")
+
+    def play(self):
+        self.run("home")
+        self.click("🏁 配置完成，去开赛")
+        self.click("🎮 即刻开赛！")
+        self.skip_countdown()
+        seed, tiebreaks = 0, 0
+        while self.at.session_state["game_stage"] == "PLAYING":
+            ss = self.at.session_state
+            if ss["round_idx"] >= len(ss["playlist"]):
+                if tiebreaks >= self.max_tiebreaks or not self.click("🔥 开启决胜局"): break  # 冠军页
+                tiebreaks += 1
+                self.skip_countdown(); continue
+            if not ss["round_finished"]:
+                if ss["config"]["referee_mode"] == "AI裁判":
+                    seed += 1
+                    _recordings.current = fake_voice(seed)
+                    self.click("🔄 再听一遍")  # 录音提交 -> 本地 VAD -> 假裁判
+                    self.click("🔄 再听一遍")  # 同一段录音重跑：应命中缓存
+                    _recordings.current = None
+                    if not ss["round_finished"]: self.click("⏭️ 跳过")
+                else:
+                    self.click("🎤 抢答开始")
+                    self.click(key=f"sel_{seed % 3}"); seed += 1
+                    self.click("✅ 判定正确 (+10)" if seed % 2 else "❌ 判定错误 (-15)")
+                    if not ss["round_finished"]: self.click("⏭️ 跳过")
+            else:
+                self.click("👉 下一题")
+                self.skip_countdown()
+        return self
+
+
+def bench_mode(referee_mode, rounds):
+    """先跑一局计时（不开 tracemalloc，免得拖慢），再跑一局只量内存峰值"""
+    t0 = time.perf_counter()
+    driver = GameDriver(referee_mode, rounds).play()
+    wall = time.perf_counter() - t0
+    tracemalloc.start()
+    GameDriver(referee_mode, rounds).play()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    by_stage = {}
+    for stage, ms, nbytes in driver.reruns:
+        by_stage.setdefault(stage, {"ms": [], "bytes": []})
+        by_stage[stage]["ms"].append(ms); by_stage[stage]["bytes"].append(nbytes)
+    return {
+        "reruns": len(driver.reruns),
+        "game_seconds": round(wall, 3),
+        "peak_memory_mb": round(peak / 2 ** 20, 2),
+        "rerun_ms": summarize([r[1] for r in driver.reruns]),
+        "rerun_bytes": summarize([r[2] for r in driver.reruns]),
+        "by_stage": {k: {"rerun_ms": summarize(v["ms"]), "rerun_bytes": summarize(v["bytes"])} for k, v in by_stage.items()},
+    }
+
+
+def warm_up(rounds):
+    """首局会建曲库索引、起媒体服务等进程级缓存；先跑掉，单独记一下冷启动耗时"""
+    t0 = time.perf_counter()
+    GameDriver("手动裁判", rounds).play()
+    return round(time.perf_counter() - t0, 3)
+
+
+def _worker_init(rounds):
+    install_fake_recorder()
+    warm_up(rounds)
+
+
+def _worker_game(i, rounds):
+    t0 = time.time()
+    d = GameDriver("手动裁判" if i % 2 == 0 else "AI裁判", rounds).play()
+    return len(d.reruns), t0, time.time()
+
+
+def bench_concurrency(sessions, rounds):
+    """AppTest 的运行时是进程级单例，不能多线程并发；改为每个会话一个进程，共享磁盘缓存"""
+    import bench  # AppTest 运行时会替换 __main__，子进程要按模块名找到这些函数
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=sessions, mp_context=ctx, initializer=bench._worker_init, initargs=(rounds,)) as pool:
+        results = list(pool.map(bench._worker_game, range(sessions), [rounds] * sessions))
+    wall = max(r[2] for r in results) - min(r[1] for r in results)
+    total_reruns = sum(r[0] for r in results)
+    return {"sessions": sessions, "wall_seconds": round(wall, 3),
+            "games_per_second": round(sessions / wall, 3), "reruns_per_second": round(total_reruns / wall, 2),
+            "game_seconds": summarize([r[2] - r[1] for r in results])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=5, choices=[3, 5, 10, 15, 20])  # 与主页滑块选项一致
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--out", default="bench_results.json")
+    args = parser.parse_args()
+
+    # 所有缓存放临时目录，媒体服务用随机端口，不联网、不碰真实数据
+    tmp = tempfile.mkdtemp(prefix="guessbench_")
+    os.environ.setdefault("JUDGE_BACKEND", "stub")
+    os.environ.setdefault("AUDIO_SERVER_PORT", "0")
+    os.environ.setdefault("ANALYSIS_AUTO", "off")
+    for name, fname in (("CATALOG_INDEX", "catalog.json"), ("CLIP_CACHE_DIR", "clips"),
+                        ("ANALYSIS_CACHE", "analysis.json"), ("PLAY_HISTORY", "play_history.json"),
+                        ("MATCH_DB", "matches.db")):
+        os.environ.setdefault(name, os.path.join(tmp, fname))
+    os.chdir(os.path.dirname(APP_PATH))
+    install_fake_recorder()
+
+    cold = warm_up(args.rounds)
+    delivery = os.environ.get("AUDIO_DELIVERY", "auto")  # 与 app.py 默认一致
+    report = {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "platform": platform.platform(), "rounds": args.rounds, "cold_start_seconds": cold,
+                 "audio_delivery": delivery, "clip_mode": os.environ.get("CLIP_MODE", "on"),
+                 # AppTest 没有请求头，auto 按“本机打开”处理，实际走媒体服务
+                 "audio_delivery_effective": "inline" if delivery == "inline" else "stream"},
+        "modes": {"手动裁判": bench_mode("手动裁判", args.rounds), "AI裁判": bench_mode("AI裁判", args.rounds)},
+        "concurrency": bench_concurrency(args.sessions, args.rounds),
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    for mode, r in report["modes"].items():
+        print(f"{mode}: {r['reruns']} 次重跑, p50 {r['rerun_ms'].get('p50')} ms, "
+              f"p95 {r['rerun_ms'].get('p95')} ms, 最大页面 {r['rerun_bytes'].get('max')} B, 峰值内存 {r['peak_memory_mb']} MB")
+    c = report["concurrency"]
+    print(f"并发 {c['sessions']} 会话: {c['reruns_per_second']} 次重跑/秒 -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""曲库索引：一次建好结构化记录，落盘为 JSON，按目录 mtime / 文件状态增量刷新"""
+import os
+import json
+import time
+import threading
+from dataclasses import dataclass, field, asdict
+
+INDEX_VERSION = 1
+ERA_MAP = {"80年代及以前": ["80s", "70s", "60s"], "90年代": ["90s"], "00年代": ["00s"], "10年代及以后": ["10s", "20s"]}
+NO_ARTIST = "暂无信息"
+
+
+@dataclass
+class SongRecord:
+    path: str
+    era: str
+    title: str
+    artists: list = field(default_factory=list)
+    duration: float = 0.0  # 秒
+    size: int = 0
+    mtime: int = 0  # 纳秒
+
+    @property
+    def singer(self):
+        return "、".join(self.artists) if self.artists else NO_ARTIST
+
+
+def _is_latin(text):
+    return all(ord(ch) < 0x2E80 for ch in text)
+
+
+def parse_filename(filename):
+    """'年代_歌名_歌手[_歌手2]' -> (era, title, artists)
+    英文歌名里的下划线要并回去：00s_Super_Star_S.H.E -> 《Super Star》 S.H.E"""
+    name_no_ext = os.path.splitext(filename)[0]
+    parts = name_no_ext.split('_')
+    if len(parts) < 2: return "", name_no_ext, []
+    era = parts[0].lower()
+    rest = parts[1:]
+    n_title = 1
+    # 纯拉丁字母的歌名与后面的拉丁词连写，留最后一段给歌手
+    while n_title < len(rest) - 1 and _is_latin(rest[n_title - 1]) and _is_latin(rest[n_title]):
+        n_title += 1
+    return era, " ".join(rest[:n_title]), rest[n_title:]
+
+
+# ---------- MP3 时长：只读帧头，不解码 ----------
+
+_BITRATES_V1_L3 = [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 0]
+_BITRATES_V2_L3 = [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0]
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def mp3_duration(path, file_size=None):
+    """优先用 Xing/Info/VBRI 帧数，否则按首帧码率估算（CBR 精确）；失败返回 0"""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(10)
+            start = 0
+            if head[:3] == b"ID3":
+                start = 10 + ((head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9])
+                if head[5] & 0x10: start += 10
+            f.seek(start)
+            buf = f.read(64 * 1024)
+    except OSError:
+        return 0.0
+    if file_size is None: file_size = os.path.getsize(path)
+
+    for i in range(len(buf) - 4):
+        if buf[i] != 0xFF or (buf[i + 1] & 0xE0) != 0xE0: continue
+        version = (buf[i + 1] >> 3) & 3
+        layer = (buf[i + 1] >> 1) & 3
+        br_idx, sr_idx = buf[i + 2] >> 4, (buf[i + 2] >> 2) & 3
+        if version == 1 or layer != 1 or br_idx in (0, 15) or sr_idx == 3: continue
+        bitrate = (_BITRATES_V1_L3 if version == 3 else _BITRATES_V2_L3)[br_idx] * 1000
+        sample_rate = _SAMPLE_RATES[version][sr_idx]
+        samples_per_frame = 1152 if version == 3 else 576
+        mono = (buf[i + 3] >> 6) == 3
+        side = (17 if mono else 32) if version == 3 else (9 if mono else 17)
+
+        xing = i + 4 + side
+        if buf[xing:xing + 4] in (b"Xing", b"Info") and len(buf) >= xing + 12 and buf[xing + 7] & 1:
+            frames = int.from_bytes(buf[xing + 8:xing + 12], "big")
+            return frames * samples_per_frame / sample_rate
+        vbri = i + 36
+        if buf[vbri:vbri + 4] == b"VBRI":
+            frames = int.from_bytes(buf[vbri + 14:vbri + 18], "big")
+            return frames * samples_per_frame / sample_rate
+        return (file_size - start - i) * 8 / bitrate
+    return 0.0
+
+
+class Catalog:
+    """全进程共享：records 按文件名索引，buckets 按年代前缀分桶，取歌即查桶"""
+
+    def __init__(self, root, index_path, check_interval=5.0, full_check_interval=300.0):
+        self.root = root
+        self.index_path = index_path
+        self.check_interval = check_interval
+        self.full_check_interval = full_check_interval
+        self.records = {}
+        self.buckets = {}
+        self._dir_mtime = None
+        self._last_check = 0.0
+        self._last_full_check = 0.0
+        self._lock = threading.RLock()
+        self._load()
+
+    # ---------- 持久化 ----------
+
+    def _load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != INDEX_VERSION or data.get("root") != os.path.abspath(self.root): return
+        self.records = {os.path.basename(t["path"]): SongRecord(**t) for t in data.get("tracks", [])}
+        self._dir_mtime = data.get("dir_mtime")
+        self._rebuild_buckets()
+
+    def _save(self):
+        data = {"version": INDEX_VERSION, "root": os.path.abspath(self.root), "dir_mtime": self._dir_mtime,
+                "tracks": [asdict(r) for r in self.records.values()]}
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.index_path)
+
+    def _rebuild_buckets(self):
+        buckets = {}
+        for name in sorted(self.records):
+            rec = self.records[name]
+            buckets.setdefault(rec.era, []).append(rec.path)
+        self.buckets = buckets
+
+    # ---------- 增量刷新 ----------
+
+    def refresh(self, force=False):
+        """节流检查目录 mtime；目录没变就跳过逐文件 stat（定期全量核对一次，兜底原地覆盖的文件）"""
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_check < self.check_interval: return False
+            self._last_check = now
+            try:
+                dir_mtime = os.stat(self.root).st_mtime_ns
+            except OSError:
+                changed = bool(self.records)
+                self.records, self.buckets = {}, {}
+                return changed
+            full_due = now - self._last_full_check >= self.full_check_interval
+            if not force and not full_due and dir_mtime == self._dir_mtime: return False
+            self._last_full_check = now
+            changed = self._scan()
+            if changed or dir_mtime != self._dir_mtime:
+                self._dir_mtime = dir_mtime
+                self._rebuild_buckets()
+                self._save()
+            return changed
+
+    def _scan(self):
+        fresh = {}
+        changed = False
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if not entry.name.endswith('.mp3') or not entry.is_file(): continue
+                st_result = entry.stat()
+                old = self.records.get(entry.name)
+                if old is not None and old.size == st_result.st_size and old.mtime == st_result.st_mtime_ns:
+                    fresh[entry.name] = old
+                    continue
+                era, title, artists = parse_filename(entry.name)
+                fresh[entry.name] = SongRecord(
+                    path=os.path.join(self.root, entry.name), era=era, title=title, artists=artists,
+                    duration=round(mp3_duration(entry.path, st_result.st_size), 2),
+                    size=st_result.st_size, mtime=st_result.st_mtime_ns)
+                changed = True
+        if fresh.keys() != self.records.keys(): changed = True
+        self.records = fresh
+        return changed
+
+    # ---------- 查询 ----------
+
+    def bucket_lists(self, era_labels):
+        """不复制，直接返回各年代桶（给选手器用）"""
+        buckets = self.buckets
+        return [buckets[prefix] for label in era_labels for prefix in ERA_MAP.get(label, []) if prefix in buckets]
+
+    def get(self, path_or_name):
+        return self.records.get(os.path.basename(path_or_name))
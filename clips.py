@@ -0,0 +1,107 @@
+"""猜歌片段缓存：每首歌预先截取几段 15~30 秒、低码率单声道的片段，存盘复用
+有分析结果（hint）时第 0 段从高潮处起，并按响度归一化增益"""
+import os
+import time
+import hashlib
+import threading
+from pydub import AudioSegment
+
+CLIP_EXTS = (".mp3", ".opus", ".ogg")
+
+
+class ClipCache:
+    """缓存键 = 源文件路径 + mtime + 大小 + 编码参数；源文件变了自动重切，超出容量按 LRU 清理"""
+
+    def __init__(self, cache_dir, max_bytes=300 * 1024 * 1024, clip_seconds=20, clips_per_track=3,
+                 bitrate="64k", fmt="mp3", channels=1, frame_rate=44100):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.clip_seconds = max(15, min(30, clip_seconds))
+        self.clips_per_track = clips_per_track
+        self.bitrate = bitrate
+        self.fmt = fmt
+        self.channels = channels
+        self.frame_rate = frame_rate
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def params_tag(self):
+        return f"{self.clip_seconds}s-{self.clips_per_track}x-{self.bitrate}-{self.channels}ch-{self.frame_rate}-{self.fmt}"
+
+    def key(self, src_path, hint=None):
+        st_result = os.stat(src_path)
+        raw = f"{os.path.abspath(src_path)}|{st_result.st_mtime_ns}|{st_result.st_size}|{self.params_tag()}|{hint}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+    def _file(self, key, index):
+        return os.path.join(self.cache_dir, f"{key}_{index}.{self.fmt}")
+
+    def _lock(self, key):
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def clip_path(self, src_path, index=0, hint=None):
+        """取第 index 段片段的路径；没有就现场生成（同一首歌多会话并发只切一次）
+        hint = (高潮起点秒数, 增益 dB)，来自 analysis"""
+        key = self.key(src_path, hint)
+        index %= self.clips_per_track
+        target = self._file(key, index)
+        if not os.path.exists(target):
+            with self._lock(key):
+                if not os.path.exists(target):
+                    self._build(src_path, key, hint)
+                    self.prune()
+        try:
+            # 只刷新 atime 供 LRU 使用；mtime 是媒体服务 ?v=/ETag 的来源，动了浏览器缓存就全失效
+            os.utime(target, ns=(time.time_ns(), os.stat(target).st_mtime_ns))
+        except OSError:
+            pass
+        return target
+
+    def clip_offsets(self, duration_ms):
+        """在全曲 15%~75% 区间均匀取起点，避开前奏和尾奏"""
+        clip_ms = self.clip_seconds * 1000
+        if duration_ms <= clip_ms: return [0] * self.clips_per_track
+        lo = int(duration_ms * 0.15)
+        hi = max(lo, min(int(duration_ms * 0.75), duration_ms - clip_ms))
+        if self.clips_per_track == 1: return [lo]
+        step = (hi - lo) / (self.clips_per_track - 1)
+        return [int(lo + step * i) for i in range(self.clips_per_track)]
+
+    def _build(self, src_path, key, hint=None):
+        audio = AudioSegment.from_file(src_path)  # 整首只解码一次，切出全部片段
+        audio = audio.set_channels(self.channels).set_frame_rate(self.frame_rate)
+        clip_ms = self.clip_seconds * 1000
+        offsets = self.clip_offsets(len(audio))
+        gain_db = 0.0
+        if hint is not None:
+            hook_start, gain_db = hint
+            offsets[0] = max(0, min(int(hook_start * 1000), len(audio) - clip_ms))
+        for i, start in enumerate(offsets):
+            clip = audio[start:start + clip_ms]
+            # 分析用的是降采样单声道，峰值可能偏低；按片段自己的峰值再兜一次，提增益不削波
+            if gain_db: clip = clip.apply_gain(min(gain_db, -1.0 - clip.max_dBFS))
+            clip = clip.fade_in(300).fade_out(800)
+            tmp = self._file(key, i) + ".part"
+            clip.export(tmp, format=self.fmt, bitrate=self.bitrate)
+            os.replace(tmp, self._file(key, i))  # 原子替换，别的会话不会读到半截文件
+
+    def prune(self):
+        """总量超过上限时，按最近访问时间从旧到新删除"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(CLIP_EXTS):
+                st_result = entry.stat()
+                entries.append((st_result.st_atime, st_result.st_size, entry.path))
+                total += st_result.st_size
+        if total <= self.max_bytes: return 0
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes: break
+            try:
+                os.remove(path); total -= size; removed += 1
+            except OSError:
+                pass
+        return removed
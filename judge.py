@@ -0,0 +1,134 @@
+"""AI 判决服务：复用模型客户端、内联音频、有界线程池 + 超时 + 退避重试，按录音内容哈希缓存结果"""
+import io
+import json
+import time
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from metrics import NOOP
+
+INLINE_LIMIT = 15 * 1024 * 1024  # 超过这个大小才走 upload_file
+FALLBACK_RESULT = {"winner_name": "", "is_correct": False, "comment": "没听清", "detected_text": ""}
+
+
+def build_prompt(correct_answer, player_names):
+    player_list_str = "、".join(player_names)
+    return f"""任务：判定猜歌。答案：《{correct_answer}》。名单：[{player_list_str}]。
+    返回 JSON: {{"detected_text": "...", "winner_name": "...", "is_correct": true/false, "comment": "..."}}"""
+
+
+def parse_judge_response(text):
+    clean_text = text.replace("```json", "").replace("```", "").strip()
+    data = json.loads(clean_text)
+    result = dict(FALLBACK_RESULT, comment="")
+    result.update({k: data[k] for k in FALLBACK_RESULT if k in data})
+    result["is_correct"] = bool(result["is_correct"])
+    return result
+
+
+class GeminiBackend:
+    """模型对象全进程只建一次；音频直接内联进请求，省掉一次 upload_file 往返"""
+
+    def __init__(self, model_name="gemini-2.5-flash"):
+        import google.generativeai as genai
+        self._genai = genai
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt, audio_bytes, mime_type, timeout):
+        if len(audio_bytes) <= INLINE_LIMIT:
+            sample = {"mime_type": mime_type, "data": audio_bytes}
+        else:
+            sample = self._genai.upload_file(io.BytesIO(audio_bytes), mime_type=mime_type)
+        response = self.model.generate_content([prompt, sample], request_options={"timeout": timeout})
+        return response.text
+
+
+class StubBackend:
+    """本地假后端，无网络；responder(prompt, audio_bytes) -> 模型原始文本"""
+
+    def __init__(self, responder=None, delay=0.0):
+        self.responder = responder or (lambda prompt, audio: json.dumps(FALLBACK_RESULT, ensure_ascii=False))
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, audio_bytes, mime_type, timeout):
+        with self._lock: self.calls += 1
+        if self.delay: time.sleep(self.delay)
+        return self.responder(prompt, audio_bytes)
+
+
+class JudgeService:
+    """所有会话共用一个实例；同一段录音（同题同名单）只调用一次后端"""
+
+    def __init__(self, backend, max_workers=4, timeout=30.0, retries=2, backoff=1.0, cache_size=256, metrics=NOOP):
+        self.backend = backend
+        self.metrics = metrics
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cache_size = cache_size
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="judge")
+        self._cache = OrderedDict()  # 键 -> Future
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def audio_key(audio_bytes, correct_answer, player_names):
+        h = hashlib.sha256(audio_bytes)
+        h.update(f"|{correct_answer}|{'、'.join(player_names)}".encode("utf-8"))
+        return h.hexdigest()
+
+    def submit(self, audio_bytes, correct_answer, player_names, mime_type="audio/wav"):
+        key = self.audio_key(audio_bytes, correct_answer, player_names)
+        with self._lock:
+            fut = self._cache.get(key)
+            if fut is not None:
+                self._cache.move_to_end(key)
+                self.metrics.inc("judge_requests_total", result="cached")
+                return fut
+            fut = self._pool.submit(self._run, key, build_prompt(correct_answer, player_names), audio_bytes, mime_type)
+            self._cache[key] = fut
+            while len(self._cache) > self.cache_size: self._cache.popitem(last=False)
+            return fut
+
+    def judge(self, audio_bytes, correct_answer, player_names, mime_type="audio/wav"):
+        """阻塞等待结果，返回 (结果, 是否真有判决)；整体超时或彻底失败返回 (“没听清”, False)
+        超时的任务仍留在缓存里，同一段录音再提交时能拿到迟到的判决"""
+        fut = self.submit(audio_bytes, correct_answer, player_names, mime_type)
+        try:
+            result = fut.result(timeout=self.timeout * (self.retries + 1) + self.backoff * 2 ** self.retries)
+        except FutureTimeout:
+            self.metrics.inc("judge_errors_total", kind="timeout")
+            return dict(FALLBACK_RESULT), False
+        if result is None: return dict(FALLBACK_RESULT), False
+        return dict(result), True
+
+    def _run(self, key, prompt, audio_bytes, mime_type):
+        for attempt in range(self.retries + 1):
+            try:
+                with self.metrics.timer("judge_backend_seconds", attempt=attempt):
+                    text = self.backend.generate(prompt, audio_bytes, mime_type, self.timeout)
+            except Exception as e:
+                self.metrics.inc("judge_errors_total", kind=type(e).__name__)
+                if attempt < self.retries:
+                    time.sleep(self.backoff * 2 ** attempt * (0.5 + random.random()))
+                    continue
+                break
+            try:
+                result = parse_judge_response(text)
+                self.metrics.inc("judge_requests_total", result="ok")
+                return result
+            except (ValueError, TypeError, AttributeError):
+                self.metrics.inc("judge_errors_total", kind="bad_response")
+                break  # 模型答非所问，重试也没用
+        self.metrics.inc("judge_requests_total", result="failed")
+        self._forget(key)  # 失败结果不缓存，下次提交还能再试
+        return None
+
+    def _forget(self, key):
+        with self._lock: self._cache.pop(key, None)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,152 @@
+"""跨局战绩：每次判定追加一条对局日志（SQLite WAL），后台线程批量写入；
+排行榜、选手正确率、歌曲难度都是随写入增量更新的汇总表，查询不扫原始日志"""
+import os
+import time
+import queue
+import random
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY, started REAL, finished REAL, referee TEXT, rules TEXT, rounds INTEGER,
+    players INTEGER, winner TEXT);
+CREATE TABLE IF NOT EXISTS rounds (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, game_id INTEGER, ts REAL, song TEXT, guesser TEXT,
+    correct INTEGER, referee TEXT, response_ms INTEGER, delta INTEGER);
+CREATE TABLE IF NOT EXISTS player_stats (
+    name TEXT PRIMARY KEY, games INTEGER DEFAULT 0, wins INTEGER DEFAULT 0, attempts INTEGER DEFAULT 0,
+    correct INTEGER DEFAULT 0, points INTEGER DEFAULT 0, last_played REAL);
+CREATE TABLE IF NOT EXISTS song_stats (
+    song TEXT PRIMARY KEY, attempts INTEGER DEFAULT 0, correct INTEGER DEFAULT 0, skips INTEGER DEFAULT 0,
+    response_ms_total INTEGER DEFAULT 0);
+CREATE INDEX IF NOT EXISTS rounds_game ON rounds (game_id);
+CREATE INDEX IF NOT EXISTS player_rank ON player_stats (wins DESC, points DESC);
+"""
+
+_FLUSH = object()
+
+
+class MatchStore:
+    """所有会话共用一个实例；record_* 只入队（脚本线程不碰磁盘），写线程攒一批一个事务提交"""
+
+    def __init__(self, path, batch_size=256, flush_interval=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn: conn.executescript(SCHEMA)
+        self._read = self._connect()
+        self._read_lock = threading.Lock()
+        self._q = queue.Queue()
+        self._thread = threading.Thread(target=self._writer, name="match-store", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL 下掉电最多丢最后一批，不会损坏
+        return conn
+
+    # ---------- 写入（入队） ----------
+
+    def start_game(self, referee, rules, rounds, players):
+        """返回本局 id（本地生成，不等写库）"""
+        game_id = (time.time_ns() // 1000) * 1000 + random.randrange(1000)
+        self._q.put(("game", (game_id, time.time(), referee, rules, rounds, len(players))))
+        return game_id
+
+    def record_round(self, game_id, song, guesser, correct, referee, response_ms=None, delta=0):
+        """一次判定：guesser=None/correct=None 表示本轮跳过"""
+        self._q.put(("round", (game_id, time.time(), os.path.basename(song), guesser,
+                               None if correct is None else int(bool(correct)), referee,
+                               None if response_ms is None else int(response_ms), int(delta))))
+
+    def finish_game(self, game_id, scores, winner):
+        """scores: [(名字, 总分)]；同一局只该调用一次"""
+        self._q.put(("finish", (game_id, time.time(), list(scores), winner)))
+
+    def flush(self, timeout=10):
+        """等队列里已有的事件全部落盘（退出前/测试用）"""
+        done = threading.Event()
+        self._q.put((_FLUSH, done))
+        return done.wait(timeout)
+
+    # ---------- 写线程 ----------
+
+    def _writer(self):
+        conn = self._connect()
+        while True:
+            batch = [self._q.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._q.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            waiters = [arg for kind, arg in batch if kind is _FLUSH]
+            try:
+                with conn:  # 一批一个事务：原始日志与汇总表一起提交
+                    for kind, arg in batch:
+                        if kind is not _FLUSH: self._apply(conn, kind, arg)
+            except sqlite3.Error:
+                pass  # 战绩不影响游戏；这一批丢掉
+            for done in waiters: done.set()
+
+    @staticmethod
+    def _apply(conn, kind, arg):
+        if kind == "game":
+            conn.execute("INSERT OR IGNORE INTO games (id, started, referee, rules, rounds, players) VALUES (?,?,?,?,?,?)", arg)
+        elif kind == "round":
+            game_id, ts, song, guesser, correct, referee, response_ms, delta = arg
+            conn.execute("INSERT INTO rounds (game_id, ts, song, guesser, correct, referee, response_ms, delta) "
+                         "VALUES (?,?,?,?,?,?,?,?)", arg)
+            if correct is None:
+                conn.execute("INSERT INTO song_stats (song, skips) VALUES (?, 1) "
+                             "ON CONFLICT(song) DO UPDATE SET skips = skips + 1", (song,))
+                return
+            conn.execute("INSERT INTO song_stats (song, attempts, correct, response_ms_total) VALUES (?, 1, ?, ?) "
+                         "ON CONFLICT(song) DO UPDATE SET attempts = attempts + 1, correct = correct + excluded.correct, "
+                         "response_ms_total = response_ms_total + excluded.response_ms_total",
+                         (song, correct, response_ms or 0))
+            if guesser:
+                conn.execute("INSERT INTO player_stats (name, attempts, correct, last_played) VALUES (?, 1, ?, ?) "
+                             "ON CONFLICT(name) DO UPDATE SET attempts = attempts + 1, correct = correct + excluded.correct, "
+                             "last_played = excluded.last_played", (guesser, correct, ts))
+        elif kind == "finish":
+            game_id, ts, scores, winner = arg
+            conn.execute("UPDATE games SET finished = ?, winner = ? WHERE id = ?", (ts, winner, game_id))
+            conn.executemany("INSERT INTO player_stats (name, games, wins, points, last_played) VALUES (?, 1, ?, ?, ?) "
+                             "ON CONFLICT(name) DO UPDATE SET games = games + 1, wins = wins + excluded.wins, "
+                             "points = points + excluded.points, last_played = excluded.last_played",
+                             [(name, int(name == winner), score, ts) for name, score in scores])
+
+    # ---------- 查询（只读汇总表） ----------
+
+    def _query(self, sql, args=()):
+        with self._read_lock:
+            return self._read.execute(sql, args).fetchall()
+
+    def leaderboard(self, limit=10):
+        rows = self._query("SELECT name, games, wins, attempts, correct, points FROM player_stats "
+                           "ORDER BY wins DESC, points DESC LIMIT ?", (limit,))
+        return [{"name": n, "games": g, "wins": w, "attempts": a, "correct": c, "points": p,
+                 "accuracy": round(c / a, 3) if a else None} for n, g, w, a, c, p in rows]
+
+    def player_accuracy(self, name):
+        rows = self._query("SELECT attempts, correct FROM player_stats WHERE name = ?", (name,))
+        return rows[0][1] / rows[0][0] if rows and rows[0][0] else None
+
+    def song_difficulty(self, prior=2.0, prior_rate=0.5):
+        """歌名 -> 难度（0 易 ~ 1 难）：答错率加先验平滑，答过一两次的歌不会一下子变成 0 或 1；跳过算答错"""
+        rows = self._query("SELECT song, attempts, correct, skips FROM song_stats")
+        return {song: 1.0 - (c + prior * prior_rate) / (a + s + prior) for song, a, c, s in rows}
+
+    def hardest_songs(self, limit=5, min_plays=3):
+        rows = self._query("SELECT song, attempts, correct, skips FROM song_stats WHERE attempts + skips >= ? "
+                           "ORDER BY CAST(correct AS REAL) / (attempts + skips) ASC LIMIT ?", (min_plays, limit))
+        return [{"song": s, "plays": a + k, "correct": c} for s, a, c, k in rows]
+
+    def close(self):
+        self.flush()
+        with self._read_lock: self._read.close()
@@ -0,0 +1,187 @@
+"""本地媒体服务：按 URL 流式提供曲库音频（Range / ETag / 长缓存），替代 base64 内嵌；也可挂接口"""
+import os
+import threading
+import email.utils
+import mimetypes
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import quote, unquote, urlsplit
+
+CHUNK_SIZE = 64 * 1024
+CACHE_CONTROL = "public, max-age=31536000, immutable"  # URL 带版本号，内容变了地址就变
+
+mimetypes.add_type("audio/mpeg", ".mp3")
+mimetypes.add_type("audio/ogg", ".opus")
+mimetypes.add_type("image/svg+xml", ".svg")
+mimetypes.add_type("text/css", ".css")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # 一屋子手机同时抢答/连推送时别被拒连
+
+
+def file_etag(st_result):
+    return f'"{st_result.st_size:x}-{st_result.st_mtime_ns:x}"'
+
+
+class MediaServer:
+    """进程级单例：一个后台线程池 HTTP 服务，按前缀挂载多个目录"""
+
+    def __init__(self, host="0.0.0.0", port=8502):
+        self.host = host
+        self.port = port
+        self.mounts = {}  # 前缀 -> 根目录(绝对路径)
+        self.handlers = {}  # 前缀 -> fn(handler, method, 剩余路径)
+        self._httpd = None
+
+    def mount(self, prefix, root):
+        self.mounts[prefix.strip("/")] = os.path.abspath(root)
+
+    def add_handler(self, prefix, fn):
+        self.handlers[prefix.strip("/")] = fn
+
+    def dispatch(self, handler, method):
+        """命中接口前缀则交给对应函数处理，返回 True"""
+        path = unquote(urlsplit(handler.path).path).lstrip("/")
+        prefix, _, rest = path.partition("/")
+        fn = self.handlers.get(prefix)
+        if fn is None: return False
+        fn(handler, method, rest)
+        return True
+
+    def url_path(self, prefix, file_path):
+        """文件 -> /前缀/文件名?v=版本，版本随 size/mtime 变化以便长缓存"""
+        st_result = os.stat(file_path)
+        name = os.path.relpath(os.path.abspath(file_path), self.mounts[prefix.strip("/")])
+        version = file_etag(st_result).strip('"')
+        return f"/{prefix.strip('/')}/{quote(name.replace(os.sep, '/'))}?v={version}"
+
+    def url_for(self, file_path):
+        """自动找到文件所在的挂载点"""
+        full = os.path.abspath(file_path)
+        for prefix, root in self.mounts.items():
+            if os.path.commonpath([root, full]) == root: return self.url_path(prefix, full)
+        raise KeyError(file_path)
+
+    def resolve(self, raw_path):
+        """URL 路径 -> 本地文件；越出挂载目录的一律拒绝"""
+        path = unquote(urlsplit(raw_path).path).lstrip("/")
+        prefix, _, rest = path.partition("/")
+        root = self.mounts.get(prefix)
+        if root is None or not rest: return None
+        full = os.path.abspath(os.path.join(root, rest))
+        if os.path.commonpath([root, full]) != root or not os.path.isfile(full): return None
+        return full
+
+    def start(self):
+        if self._httpd is not None: return self
+        server = self
+
+        class Handler(_MediaHandler):
+            media = server
+
+        self._httpd = _Server((self.host, self.port), Handler)
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name="media-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown(); self._httpd.server_close(); self._httpd = None
+
+
+class _MediaHandler(BaseHTTPRequestHandler):
+    media = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):  # 静音，避免刷屏
+        pass
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        if self.media.dispatch(self, "GET"): return
+        self._serve(send_body=True)
+
+    def do_POST(self):
+        if self.media.dispatch(self, "POST"): return
+        self.send_response(405); self.send_header("Content-Length", "0"); self.end_headers()
+
+    def _serve(self, send_body):
+        full = self.media.resolve(self.path)
+        if full is None:
+            self.send_response(404); self.send_header("Content-Length", "0"); self.end_headers(); return
+
+        st_result = os.stat(full)
+        size = st_result.st_size
+        etag = file_etag(st_result)
+        last_modified = email.utils.formatdate(st_result.st_mtime, usegmt=True)
+
+        # 条件请求：浏览器已有缓存则 304
+        inm = self.headers.get("If-None-Match")
+        ims = self.headers.get("If-Modified-Since")
+        not_modified = inm == etag if inm else False
+        if not inm and ims:
+            try: not_modified = int(st_result.st_mtime) <= email.utils.parsedate_to_datetime(ims).timestamp()
+            except (TypeError, ValueError): pass
+        if not_modified:
+            self.send_response(304); self._common_headers(etag, last_modified); self.end_headers(); return
+
+        start, end = 0, size - 1
+        status = 200
+        rng = self.headers.get("Range")
+        if rng and (self.headers.get("If-Range") in (None, etag, last_modified)):
+            parsed = _parse_range(rng, size)
+            if parsed is None:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0"); self.end_headers(); return
+            start, end = parsed
+            status = 206
+
+        length = end - start + 1
+        self.send_response(status)
+        self._common_headers(etag, last_modified)
+        self.send_header("Content-Type", mimetypes.guess_type(full)[0] or "application/octet-stream")
+        self.send_header("Content-Length", str(length))
+        if status == 206: self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if not send_body: return
+
+        try:
+            with open(full, "rb") as f:
+                f.seek(start)
+                remaining = length
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk: break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 手机切歌/拖动进度条时浏览器会主动断开
+
+    def _common_headers(self, etag, last_modified):
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        self.send_header("Cache-Control", CACHE_CONTROL)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Access-Control-Allow-Origin", "*")
+
+
+def _parse_range(header, size):
+    """只支持单段 bytes=a-b / a- / -n；无法满足返回 None"""
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec or size == 0: return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            n = int(last)
+            if n <= 0: return None
+            return max(0, size - n), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start: return None
+    return start, min(end, size - 1)
@@ -0,0 +1,212 @@
+"""运行时埋点：计数器、活跃会话数和对数分桶直方图（p50/p95/p99），导出 Prometheus 文本格式，可选写 JSONL 轨迹
+关闭时 timer()/observe()/inc() 都是一次属性判断就返回，热路径上几乎零开销"""
+import json
+import math
+import time
+import queue
+import bisect
+import threading
+
+# 直方图分桶：1e-4 ~ 1e8，每档 x1.19（2 的 1/4 次方），分位数估计相对误差 < 10%
+_GROWTH = 2 ** 0.25
+BUCKETS = [1e-4 * _GROWTH ** i for i in range(int(math.log(1e12, _GROWTH)) + 1)]
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """固定对数分桶，observe 是一次二分 + 计数；分位数在桶内按几何插值"""
+
+    __slots__ = ("counts", "total", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+        if value > self.max: self.max = value
+
+    def quantile(self, q):
+        if self.count == 0: return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                lo = BUCKETS[i - 1] if i > 0 else 0.0
+                hi = BUCKETS[i] if i < len(BUCKETS) else self.max
+                frac = (rank - seen) / c
+                v = lo * (hi / lo) ** frac if lo > 0 else hi * frac
+                return min(v, self.max)
+            seen += c
+        return self.max
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "t0")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics, self.name, self.labels = metrics, name, labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        labels = self.labels if exc_type is None else dict(self.labels, error=exc_type.__name__)
+        self.metrics.observe(self.name, time.perf_counter() - self.t0, **labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self): return self
+    def __exit__(self, exc_type, exc, tb): return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """指标表：名字 -> {标签元组 -> 值}。所有修改在一把锁里，锁内只做加法"""
+
+    def __init__(self, enabled=True, trace_path=None, prefix="guessgame", session_window=300):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.session_window = session_window  # 秒；这段时间内有过重跑的会话算“活跃”
+        self._counters = {}
+        self._hists = {}
+        self._help = {}
+        self._sessions = {}  # 会话 id -> 最近一次重跑的时刻
+        self._lock = threading.Lock()
+        self._trace = None
+        if enabled and trace_path: self._trace = _TraceWriter(trace_path)
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    # ---------- 记录 ----------
+
+    def timer(self, name, **labels):
+        """with metrics.timer("xxx_seconds", stage=...): ...；出异常时额外带 error 标签"""
+        return _Timer(self, name, labels) if self.enabled else _NULL_TIMER
+
+    def observe(self, name, value, **labels):
+        if not self.enabled: return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._hists.setdefault(name, {})
+            h = series.get(key)
+            if h is None: h = series[key] = Histogram()
+            h.observe(value)
+        if self._trace is not None: self._trace.write(name, value, labels)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled: return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+        if self._trace is not None: self._trace.write(name, value, labels)
+
+    def touch_session(self, session_id):
+        if not self.enabled: return
+        with self._lock: self._sessions[session_id] = time.monotonic()
+
+    def active_sessions(self):
+        cutoff = time.monotonic() - self.session_window
+        with self._lock:
+            for sid in [s for s, t in self._sessions.items() if t < cutoff]: del self._sessions[sid]
+            return len(self._sessions)
+
+    # ---------- 导出 ----------
+
+    def snapshot(self):
+        """JSON 友好的汇总（调试面板/压测脚本用）"""
+        with self._lock:
+            hists = {name: [(dict(k), h.count, h.total, h.max, [h.quantile(q) for q in QUANTILES]) for k, h in series.items()]
+                     for name, series in self._hists.items()}
+            counters = {name: [(dict(k), v) for k, v in series.items()] for name, series in self._counters.items()}
+        out = {"active_sessions": self.active_sessions(), "counters": counters, "histograms": {}}
+        for name, rows in hists.items():
+            out["histograms"][name] = [dict(labels=labels, count=n, mean=total / n if n else 0.0, max=mx,
+                                            **{f"p{int(q * 100)}": v for q, v in zip(QUANTILES, qs)})
+                                       for labels, n, total, mx, qs in rows]
+        return out
+
+    def render_prometheus(self):
+        """Prometheus 文本格式；直方图按 summary 输出 p50/p95/p99 + _sum/_count"""
+        p = self.prefix
+        lines = [f"# TYPE {p}_active_sessions gauge", f"{p}_active_sessions {self.active_sessions()}"]
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help: lines.append(f"# HELP {p}_{name} {self._help[name]}")
+                lines.append(f"# TYPE {p}_{name} counter")
+                lines.extend(f"{p}_{name}{_labels(k)} {v}" for k, v in series.items())
+            for name, series in sorted(self._hists.items()):
+                if name in self._help: lines.append(f"# HELP {p}_{name} {self._help[name]}")
+                lines.append(f"# TYPE {p}_{name} summary")
+                for k, h in series.items():
+                    for q in QUANTILES:
+                        lines.append(f"{p}_{name}{_labels(k + (('quantile', str(q)),))} {h.quantile(q):.6g}")
+                    lines.append(f"{p}_{name}_sum{_labels(k)} {h.total:.6g}")
+                    lines.append(f"{p}_{name}_count{_labels(k)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def handle_http(self, handler, method, rest):
+        """GET /metrics（挂到 MediaServer 上）"""
+        body = self.render_prometheus().encode("utf-8") if method == "GET" else b""
+        handler.send_response(200 if method == "GET" else 405)
+        handler.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.send_header("Cache-Control", "no-store")
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def close(self):
+        if self._trace is not None: self._trace.close()
+
+
+def _labels(key):
+    if not key: return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in key) + "}"
+
+
+class _TraceWriter:
+    """JSONL 轨迹：脚本线程只入队，后台线程批量写盘"""
+
+    def __init__(self, path):
+        self.path = path
+        self._q = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._loop, name="metrics-trace", daemon=True)
+        self._thread.start()
+
+    def write(self, name, value, labels):
+        self._q.put((time.time(), name, value, labels))
+
+    def _loop(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                item = self._q.get()
+                if item is None: break
+                while item is not None:
+                    ts, name, value, labels = item
+                    f.write(json.dumps({"ts": round(ts, 4), "metric": name, "value": value, **labels}, ensure_ascii=False) + "\n")
+                    try:
+                        item = self._q.get_nowait()
+                    except queue.Empty:
+                        break
+                f.flush()
+                if item is None: break
+
+    def close(self):
+        self._q.put(None)
+        self._thread.join(timeout=2)
+
+
+NOOP = Metrics(enabled=False)  # 未启用埋点时各模块的默认值
@@ -0,0 +1,110 @@
+"""浏览器端动画与倒计时：遮罩用 CSS 动画一次下发，倒计时由 JS 计时器到点回报一次，脚本线程不再 sleep"""
+import os
+import time
+import uuid
+import streamlit as st
+import streamlit.components.v1 as components
+
+TIMER_TOLERANCE = 0.5  # 秒；浏览器时钟略快时也接受到点回报
+GATE_GRACE = 2.0  # 秒；组件没回报时，服务端过了这段宽限自己判定到点
+
+_countdown_timer = components.declare_component(
+    "countdown_timer", path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "countdown_timer"))
+
+# 遮罩所需的关键帧，随全局样式下发
+OVERLAY_CSS = """
+@keyframes overlay-out { to { opacity: 0; visibility: hidden; pointer-events: none; } }
+@keyframes overlay-bar { from { width: 100%; } to { width: 0%; } }
+@keyframes cd-digit { 0% { visibility: visible; transform: scale(1.3); } 99.9% { visibility: visible; transform: scale(1); } 100% { visibility: hidden; } }
+"""
+
+
+def overlay_html(title, sub_text, color, duration, icon, elapsed=0.0):
+    """全屏提示；进度条与淡出都交给 CSS，elapsed 用负延迟续上重跑前的进度"""
+    return f"""
+        <div style="position: fixed; top: 0; left: 0; width: 100%; height: 100%;
+            background: rgba(255, 255, 255, 0.98); z-index: 9999;
+            display: flex; align-items: center; justify-content: center;
+            flex-direction: column; text-align: center;
+            animation: overlay-out 0.3s ease {duration - elapsed:.2f}s forwards;">
+            <div style="font-size: 80px; margin-bottom: 20px;">{icon}</div>
+            <h1 style="font-size: 70px; color: {color}; margin: 0; text-shadow: 0px 4px 10px rgba(0,0,0,0.1);">{title}</h1>
+            <h2 style="color: #555; font-size: 35px; margin-top: 20px; font-weight: normal;">{sub_text}</h2>
+            <div style="margin-top: 30px; width: 200px; height: 5px; background: #eee;">
+                <div style="height: 100%; background: {color}; animation: overlay-bar {duration}s linear -{elapsed:.2f}s forwards;"></div>
+            </div>
+        </div>
+    """
+
+
+def countdown_html(seconds, title, elapsed=0.0):
+    """大数字倒数：每个数字各占一秒，依次显现"""
+    digits = "".join(
+        f'<span style="position: absolute; left: 0; right: 0; visibility: hidden; '
+        f'animation: cd-digit 1s linear {k - elapsed:.2f}s forwards;">{seconds - k}</span>'
+        for k in range(seconds))
+    return f"""
+        <div style="position: fixed; top: 0; left: 0; width: 100%; height: 100%;
+            background: rgba(255, 255, 255, 0.95); z-index: 9999;
+            display: flex; align-items: center; justify-content: center;
+            flex-direction: column;">
+            <div style="position: relative; width: 300px; height: 220px; font-size: 180px; color: #FF4B4B; font-weight: bold; text-align: center;">{digits}</div>
+            <h2 style="color: #333; font-size: 40px;">{title}</h2>
+        </div>
+    """
+
+
+# ---------- 提示遮罩：排队后每次重跑续播，到时自动消失 ----------
+
+def show_overlay_message(title, sub_text="", color="#FF4B4B", duration=3, icon=""):
+    st.session_state.overlay = {"args": (title, sub_text, color, duration, icon), "start": time.time()}
+    st.markdown(overlay_html(title, sub_text, color, duration, icon), unsafe_allow_html=True)
+
+
+def render_pending_overlay():
+    ov = st.session_state.get("overlay")
+    if not ov: return
+    elapsed = time.time() - ov["start"]
+    title, sub_text, color, duration, icon = ov["args"]
+    if elapsed >= duration:
+        st.session_state.overlay = None; return
+    st.markdown(overlay_html(title, sub_text, color, duration, icon, elapsed), unsafe_allow_html=True)
+
+
+# ---------- 开播倒计时：倒数期间拦住页面，到点再进入下一步 ----------
+
+def show_countdown_overlay(seconds=3, title="即将播放..."):
+    cancel_timer("countdown")
+    st.session_state.countdown = {"seconds": seconds, "title": title, "start": time.time()}
+
+
+def run_countdown_gate():
+    """倒数未结束时只渲染遮罩并停止本次脚本；浏览器到点回报后重跑进入正文"""
+    cd = st.session_state.get("countdown")
+    if not cd: return
+    elapsed = time.time() - cd["start"]
+    if elapsed >= cd["seconds"] + GATE_GRACE or client_timer("countdown", cd["seconds"], style="hidden", start=cd["start"]):
+        st.session_state.countdown = None; cancel_timer("countdown"); return
+    st.markdown(countdown_html(cd["seconds"], cd["title"], elapsed), unsafe_allow_html=True)
+    st.stop()
+
+
+# ---------- 通用计时器 ----------
+
+def client_timer(name, seconds, style="number", start=None):
+    """启动/续用名为 name 的浏览器端倒计时；到点时返回 True，同一个计时器只返回一次"""
+    timers = st.session_state.setdefault("client_timers", {})
+    now = time.time()
+    t = timers.get(name)
+    if t is None:
+        t = timers[name] = {"id": uuid.uuid4().hex, "deadline": (start or now) + seconds}
+    value = _countdown_timer(timer_id=t["id"], remaining_ms=max(0, int((t["deadline"] - now) * 1000)),
+                             total_ms=int(seconds * 1000), style=style, key=f"client_timer_{name}", default=None)
+    if value and value.get("id") == t["id"] and now >= t["deadline"] - TIMER_TOLERANCE:
+        del timers[name]
+        return True
+    return False
+
+
+def cancel_timer(name):
+    st.session_state.setdefault("client_timers", {}).pop(name, None)
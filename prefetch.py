@@ -0,0 +1,54 @@
+"""下一轮音频预取：全进程共用一个小线程池，每个会话一个有界缓存"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def make_pool(max_workers=2):
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+
+
+class PrefetchCache:
+    """键 -> Future；超出容量淘汰最旧的（尚未开始的任务顺便取消）"""
+
+    def __init__(self, pool, capacity=3):
+        self.pool = pool
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def prefetch(self, key, fn, *args):
+        with self._lock:
+            fut = self._items.get(key)
+            if fut is not None:
+                self._items.move_to_end(key)
+                return fut
+            fut = self.pool.submit(fn, *args)
+            self._items[key] = fut
+            while len(self._items) > self.capacity:
+                _, old = self._items.popitem(last=False)
+                old.cancel()
+            return fut
+
+    def get(self, key, fn, *args, timeout=None):
+        """取结果：已预取好直接返回；还在跑就等它；预取失败则当场重做一次"""
+        fut = self.prefetch(key, fn, *args)
+        try:
+            return fut.result(timeout=timeout)
+        except Exception:
+            self.discard(key)
+            return fn(*args)
+
+    def is_ready(self, key):
+        fut = self._items.get(key)
+        return fut is not None and fut.done() and not fut.cancelled() and fut.exception() is None
+
+    def discard(self, key):
+        with self._lock:
+            fut = self._items.pop(key, None)
+        if fut is not None: fut.cancel()
+
+    def clear(self):
+        with self._lock:
+            items, self._items = list(self._items.values()), OrderedDict()
+        for fut in items: fut.cancel()
@@ -0,0 +1,212 @@
+"""多设备房间：进程级房间表，服务端按到达先后裁定抢答，比分通过 SSE 推送给每台手机"""
+import json
+import time
+import random
+import threading
+
+ROOM_CODE_CHARS = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"  # 去掉易混的 I/O/0/1
+ROOM_CODE_LEN = 4
+ROOM_TTL = 3 * 3600  # 秒；无人活动的房间定期清掉
+SSE_KEEPALIVE = 15  # 秒
+
+
+class Room:
+    """一局一个房间；所有读写都在 self._cond 的锁里，变更时 version+1 并唤醒等待者"""
+
+    def __init__(self, code, players=None):
+        self.code = code
+        self.players = players if players is not None else []  # 与主持人会话共享的选手 dict 列表
+        self.stage = "HOME"
+        self.round_idx = 0
+        self.total_rounds = 0
+        self.buzz_open = False
+        self.buzz_winner = None
+        self.buzz_log = []  # 本轮 [(名字, 到达时刻)]，按先后排列
+        self.closed = False
+        self.version = 0
+        self.last_active = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _changed(self):
+        self.version += 1
+        self.last_active = time.monotonic()
+        self._cond.notify_all()
+
+    def _find(self, name):
+        return next((p for p in self.players if p['name'] == name), None)
+
+    # ---------- 选手 ----------
+
+    def join(self, name, avatar):
+        with self._cond:
+            p = self._find(name)
+            if p is None:
+                p = {"name": name, "avatar": avatar, "score": 0}
+                self.players.append(p)
+                self._changed()
+            return p
+
+    def leave(self, name):
+        with self._cond:
+            p = self._find(name)
+            if p is not None:
+                self.players.remove(p); self._changed()
+
+    def add_score(self, name, delta):
+        with self._cond:
+            p = self._find(name)
+            if p is not None:
+                p['score'] += delta; self._changed()
+
+    def reset_scores(self):
+        with self._cond:
+            for p in self.players: p['score'] = 0
+            self._changed()
+
+    # ---------- 进度 ----------
+
+    def sync(self, stage, round_idx, total_rounds):
+        """主持人每次重跑同步一次；没变化就不打扰客户端"""
+        with self._cond:
+            if (self.stage, self.round_idx, self.total_rounds) != (stage, round_idx, total_rounds):
+                self.stage, self.round_idx, self.total_rounds = stage, round_idx, total_rounds
+                self._changed()
+
+    def close(self):
+        with self._cond:
+            self.closed = True; self.buzz_open = False; self._changed()
+
+    # ---------- 抢答 ----------
+
+    def ensure_buzzer_open(self, round_idx):
+        """本轮还没人抢到且抢答器关着时开放（已开放则什么也不做）"""
+        with self._cond:
+            if self.buzz_open or self.buzz_winner is not None: return
+            self.buzz_open = True; self.round_idx = round_idx; self.buzz_log = []
+            self._changed()
+
+    def close_buzzer(self):
+        with self._cond:
+            if self.buzz_open or self.buzz_winner is not None:
+                self.buzz_open = False; self.buzz_winner = None; self._changed()
+
+    def buzz(self, name, t=None):
+        """先到先得：锁内按单调时钟记录到达时刻，第一个有效抢答者获胜并立即关闭抢答"""
+        t = time.monotonic() if t is None else t
+        with self._cond:
+            if not self.buzz_open or self._find(name) is None: return False, self.buzz_winner
+            self.buzz_log.append((name, t))
+            self.buzz_open = False
+            self.buzz_winner = name
+            self._changed()
+            return True, name
+
+    def take_buzz_winner(self):
+        """主持人取走抢到的人（只会取到一次），抢答器保持关闭直到再次开放"""
+        with self._cond:
+            name, self.buzz_winner = self.buzz_winner, None
+            if name is not None: self._changed()
+            return self._find(name) if name is not None else None
+
+    # ---------- 推送 ----------
+
+    def snapshot(self):
+        with self._cond:
+            return {"code": self.code, "version": self.version, "stage": self.stage, "closed": self.closed,
+                    "round_idx": self.round_idx, "total_rounds": self.total_rounds,
+                    "buzz_open": self.buzz_open, "buzz_winner": self.buzz_winner,
+                    "players": [dict(p) for p in self.players]}
+
+    def wait(self, since_version, timeout=SSE_KEEPALIVE):
+        """阻塞到 version 变化或超时，返回最新快照"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != since_version, timeout)
+        return self.snapshot()
+
+
+class RoomRegistry:
+    def __init__(self, ttl=ROOM_TTL):
+        self.ttl = ttl
+        self._rooms = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def create(self, players=None):
+        self.prune()
+        with self._lock:
+            while True:
+                code = "".join(random.choice(ROOM_CODE_CHARS) for _ in range(ROOM_CODE_LEN))
+                if code not in self._rooms: break
+            room = self._rooms[code] = Room(code, players)
+            return room
+
+    def get(self, code):
+        return self._rooms.get((code or "").strip().upper())
+
+    def close(self, code):
+        with self._lock:
+            room = self._rooms.pop(code, None)
+        if room is not None: room.close()
+
+    def prune(self):
+        now = time.monotonic()
+        with self._lock:
+            stale = [c for c, r in self._rooms.items() if now - r.last_active > self.ttl]
+            rooms = [self._rooms.pop(c) for c in stale]
+        for r in rooms: r.close()
+        return len(rooms)
+
+    # ---------- HTTP（挂到 MediaServer 的 /rooms 下） ----------
+
+    def handle_http(self, handler, method, rest):
+        """GET /rooms/<code> 快照；GET /rooms/<code>/events SSE；POST /rooms/<code>/buzz 抢答"""
+        code, _, action = rest.partition("/")
+        room = self.get(code)
+        if room is None: return _send_json(handler, 404, {"error": "no such room"})
+        if method == "GET" and action == "": return _send_json(handler, 200, room.snapshot())
+        if method == "GET" and action == "events": return _stream_events(handler, room)
+        if method == "POST" and action == "buzz":
+            try:
+                length = int(handler.headers.get("Content-Length", 0))
+                name = json.loads(handler.rfile.read(length) or b"{}").get("name", "")
+            except (ValueError, AttributeError):
+                return _send_json(handler, 400, {"error": "bad request"})
+            ok, winner = room.buzz(name)
+            return _send_json(handler, 200, {"ok": ok, "winner": winner})
+        return _send_json(handler, 404, {"error": "not found"})
+
+
+def _send_json(handler, status, payload):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    handler.send_response(status)
+    handler.send_header("Content-Type", "application/json; charset=utf-8")
+    handler.send_header("Content-Length", str(len(body)))
+    handler.send_header("Cache-Control", "no-store")
+    handler.send_header("Access-Control-Allow-Origin", "*")
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+def _stream_events(handler, room):
+    """每次 version 变化推一条快照；空闲时发注释行保活。每条连接占一个服务线程"""
+    handler.close_connection = True
+    handler.send_response(200)
+    handler.send_header("Content-Type", "text/event-stream; charset=utf-8")
+    handler.send_header("Cache-Control", "no-store")
+    handler.send_header("Access-Control-Allow-Origin", "*")
+    handler.end_headers()
+    version = None
+    try:
+        while True:
+            snap = room.wait(version)
+            if snap["version"] == version:
+                handler.wfile.write(b": keepalive\n\n")
+            else:
+                version = snap["version"]
+                handler.wfile.write(f"data: {json.dumps(snap, ensure_ascii=False)}\n\n".encode("utf-8"))
+            handler.wfile.flush()
+            if snap["closed"]: break
+    except (BrokenPipeError, ConnectionResetError):
+        pass
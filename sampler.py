@@ -0,0 +1,132 @@
+"""选歌器：按年代桶做 O(k) 无放回抽样（可加权），并跨局记住播放历史，近期听过的歌不再出"""
+import os
+import math
+import time
+import json
+import random
+import bisect
+import threading
+
+DAY = 86400.0
+
+
+class PlayHistory:
+    """歌名 -> [最后播放时间, 播放次数]；追加写日志，攒够行数再压缩成快照"""
+
+    def __init__(self, path, exclude_days=3.0, compact_every=5000):
+        self.path = path
+        self.log_path = path + ".log"
+        self.exclude_seconds = exclude_days * DAY
+        self.compact_every = compact_every
+        self.plays = {}
+        self._log_lines = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.plays = {k: list(v) for k, v in json.load(f).items()}
+        except (OSError, ValueError):
+            self.plays = {}
+        try:
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    ts, _, name = line.rstrip("\n").partition("\t")
+                    if name: self._apply(name, float(ts)); self._log_lines += 1
+        except (OSError, ValueError):
+            pass
+
+    def _apply(self, name, ts):
+        rec = self.plays.get(name)
+        if rec is None: self.plays[name] = [ts, 1]
+        else: rec[0] = max(rec[0], ts); rec[1] += 1
+
+    def record(self, paths, ts=None):
+        ts = time.time() if ts is None else ts
+        names = [os.path.basename(p) for p in paths]
+        with self._lock:
+            for name in names: self._apply(name, ts)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.writelines(f"{ts:.0f}\t{name}\n" for name in names)
+            self._log_lines += len(names)
+            if self._log_lines >= self.compact_every: self._compact()
+
+    def _compact(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.plays, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self.path)
+        open(self.log_path, "w").close()
+        self._log_lines = 0
+
+    def last_played(self, path):
+        rec = self.plays.get(os.path.basename(path))
+        return rec[0] if rec else None
+
+    def play_count(self, path):
+        rec = self.plays.get(os.path.basename(path))
+        return rec[1] if rec else 0
+
+    def is_recent(self, path, now=None):
+        last = self.last_played(path)
+        return last is not None and (now or time.time()) - last < self.exclude_seconds
+
+    def recency_weight(self, path, now=None, tau_days=14.0):
+        """没听过 = 1；越久没听越接近 1，刚听过接近 0（“最久未播优先”）"""
+        last = self.last_played(path)
+        if last is None: return 1.0
+        return 1.0 - math.exp(-max(0.0, (now or time.time()) - last) / (tau_days * DAY))
+
+
+class SongSampler:
+    """在若干桶（每桶一个歌曲路径列表）上抽样，不拼接、不复制，期望 O(k)"""
+
+    def __init__(self, history=None, rng=None, max_tries_factor=30):
+        self.history = history
+        self.rng = rng or random.Random()
+        self.max_tries_factor = max_tries_factor
+
+    def draw(self, buckets, k, bucket_weights=None, exclude=(), weight_fn=None):
+        """buckets: [[路径...], ...]；bucket_weights 控制年代配比（默认按桶大小，即逐首均匀）
+        weight_fn(path) -> [0, 1] 作为接受概率（最久未播、难度等）。候选不够时逐级放宽条件"""
+        pairs = [(b, w) for b, w in zip(buckets, bucket_weights or [len(b) for b in buckets]) if b and w > 0]
+        if not pairs or k <= 0: return []
+        lists = [b for b, _ in pairs]
+        cum = []
+        acc = 0.0
+        for _, w in pairs:
+            acc += w; cum.append(acc)
+        seen = set(exclude)
+        chosen = []
+        now = time.time()
+        rng = self.rng
+
+        def pick():
+            b = lists[bisect.bisect_right(cum, rng.random() * acc)] if len(lists) > 1 else lists[0]
+            return b[rng.randrange(len(b))]
+
+        # 第一轮：拒绝采样，排除近期播过的并按权重接受
+        tries, limit = 0, self.max_tries_factor * k + 100
+        while len(chosen) < k and tries < limit:
+            tries += 1
+            item = pick()
+            if item in seen: continue
+            if self.history is not None and self.history.is_recent(item, now): continue
+            if weight_fn is not None and rng.random() > weight_fn(item): continue
+            seen.add(item); chosen.append(item)
+        if len(chosen) < k:
+            # 候选太少（小曲库/历史很长）：放宽为只排除已选，线性补齐
+            rest = [p for b in lists for p in b if p not in seen]
+            if self.history is not None:
+                rest.sort(key=lambda p: self.history.last_played(p) or 0.0)  # 最久没播的优先
+                rest = rest[: k - len(chosen)]
+            rng.shuffle(rest)
+            chosen.extend(rest[: k - len(chosen)])
+        return chosen
+
+    def draw_one(self, buckets, exclude=(), weight_fn=None):
+        """决胜局补一首：期望常数时间"""
+        picked = self.draw(buckets, 1, exclude=exclude, weight_fn=weight_fn)
+        return picked[0] if picked else None
@@ -0,0 +1,86 @@
+"""判决服务：用本地假后端检查缓存、失败重试和超时后再取迟到的判决
+
+用法：python -m pytest -q test_judge.py
+"""
+import json
+import time
+import threading
+import unittest
+
+from judge import JudgeService, StubBackend
+
+NAMES = ["爸爸", "妈妈", "宝宝"]
+VERDICT = {"detected_text": "容易受伤的女人", "winner_name": "妈妈", "is_correct": True, "comment": "对了"}
+
+
+def answer(prompt, audio):
+    return json.dumps(VERDICT, ensure_ascii=False)
+
+
+class Flaky:
+    """前 fail_times 次抛错，之后正常回答"""
+
+    def __init__(self, fail_times):
+        self.fail_times = fail_times
+
+    def __call__(self, prompt, audio):
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise ConnectionError("network down")
+        return answer(prompt, audio)
+
+
+class JudgeServiceTest(unittest.TestCase):
+
+    def make(self, backend, **kwargs):
+        service = JudgeService(backend, backoff=0.0, **kwargs)
+        self.addCleanup(service.shutdown)
+        return service
+
+    def test_same_audio_calls_backend_once(self):
+        backend = StubBackend(answer, delay=0.1)
+        service = self.make(backend)
+        start, results = threading.Barrier(5), []
+
+        def submit():
+            start.wait()
+            results.append(service.judge(b"voice", "容易受伤的女人", NAMES))
+
+        threads = [threading.Thread(target=submit) for _ in range(5)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        self.assertEqual(backend.calls, 1)
+        self.assertTrue(all(r == (VERDICT, True) for r in results))
+        self.assertEqual(service.judge(b"voice", "容易受伤的女人", NAMES), (VERDICT, True))
+        self.assertEqual(backend.calls, 1)
+        service.judge(b"other voice", "容易受伤的女人", NAMES)
+        self.assertEqual(backend.calls, 2)
+
+    def test_transient_failure_is_retried(self):
+        backend = StubBackend(Flaky(2))
+        service = self.make(backend, retries=2)
+        self.assertEqual(service.judge(b"voice", "容易受伤的女人", NAMES), (VERDICT, True))
+        self.assertEqual(backend.calls, 3)
+
+    def test_failure_is_not_cached(self):
+        backend = StubBackend(Flaky(3))
+        service = self.make(backend, retries=2)
+        result, judged = service.judge(b"voice", "容易受伤的女人", NAMES)
+        self.assertFalse(judged)
+        self.assertEqual(backend.calls, 3)
+        # 同一段录音再提交会重新调用后端，而不是拿到缓存的“没听清”
+        self.assertEqual(service.judge(b"voice", "容易受伤的女人", NAMES), (VERDICT, True))
+        self.assertEqual(backend.calls, 4)
+
+    def test_late_verdict_after_timeout(self):
+        backend = StubBackend(answer, delay=0.5)
+        service = self.make(backend, timeout=0.1, retries=0)
+        result, judged = service.judge(b"voice", "容易受伤的女人", NAMES)
+        self.assertFalse(judged)
+        time.sleep(0.6)
+        self.assertEqual(service.judge(b"voice", "容易受伤的女人", NAMES), (VERDICT, True))
+        self.assertEqual(backend.calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
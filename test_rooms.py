@@ -0,0 +1,84 @@
+"""房间抢答：模拟多台手机同时 POST /rooms/<code>/buzz，主持人一侧按 app.py 手动裁判的顺序调用
+
+用法：python -m pytest -q test_rooms.py
+"""
+import json
+import threading
+import unittest
+import urllib.request
+
+from media_server import MediaServer
+from rooms import RoomRegistry
+
+NAMES = ["爸爸", "妈妈", "宝宝", "爷爷", "奶奶", "外婆", "外公", "舅舅"]
+
+
+class BuzzerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = RoomRegistry()
+        self.srv = MediaServer(host="127.0.0.1", port=0)
+        self.srv.add_handler("rooms", self.registry.handle_http)
+        self.srv.start()
+        self.room = self.registry.create()
+        for name in NAMES: self.room.join(name, "")
+
+    def tearDown(self):
+        self.registry.close(self.room.code)
+        self.srv.stop()
+
+    def phone_buzz(self, name):
+        req = urllib.request.Request(f"http://127.0.0.1:{self.srv.port}/rooms/{self.room.code}/buzz", method="POST",
+                                     data=json.dumps({"name": name}).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            return json.loads(resp.read())
+
+    def buzz_all(self):
+        """所有手机同时按下，返回 名字 -> 响应"""
+        start, results = threading.Barrier(len(NAMES)), {}
+
+        def press(name):
+            start.wait()
+            results[name] = self.phone_buzz(name)
+
+        threads = [threading.Thread(target=press, args=(n,)) for n in NAMES]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        return results
+
+    def test_first_buzz_wins(self):
+        self.room.ensure_buzzer_open(0)
+        results = self.buzz_all()
+        winners = [n for n, r in results.items() if r["ok"]]
+        self.assertEqual(len(winners), 1)
+        self.assertTrue(all(r["winner"] == winners[0] for r in results.values()))
+        self.assertEqual(self.room.take_buzz_winner()["name"], winners[0])
+        self.assertIsNone(self.room.take_buzz_winner())  # 只会取到一次
+
+    def test_buzz_while_closed_is_rejected(self):
+        self.assertFalse(self.phone_buzz(NAMES[0])["ok"])
+        self.assertIsNone(self.room.take_buzz_winner())
+
+    def test_late_buzz_after_manual_select(self):
+        # 主持人在 IDLE 开放抢答，随后点“抢答开始”改为现场点人
+        self.room.ensure_buzzer_open(0)
+        self.room.close_buzzer()
+        # 选人、判定期间手机上又有人按了
+        self.assertFalse(any(r["ok"] for r in self.buzz_all().values()))
+        # 判错回到 IDLE：重新开放，不能带出刚才的迟到抢答
+        self.room.ensure_buzzer_open(0)
+        self.assertIsNone(self.room.take_buzz_winner())
+        self.assertTrue(self.phone_buzz(NAMES[1])["ok"])
+        self.assertEqual(self.room.take_buzz_winner()["name"], NAMES[1])
+
+    def test_next_round_clears_winner(self):
+        self.room.ensure_buzzer_open(0)
+        self.phone_buzz(NAMES[0])
+        self.room.close_buzzer()  # 本轮结束
+        self.room.ensure_buzzer_open(1)
+        self.assertIsNone(self.room.take_buzz_winner())
+
+
+if __name__ == "__main__":
+    unittest.main()
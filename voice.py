@@ -0,0 +1,115 @@
+"""录音预处理：向量化能量 VAD、去首尾静音、单声道 16 kHz 再编码成 Opus，没说话的录音本地直接拒掉"""
+import io
+import time
+from dataclasses import dataclass, field
+from math import gcd
+import numpy as np
+from scipy.io import wavfile
+from scipy.signal import resample_poly
+
+TARGET_RATE = 16000
+FRAME_MS = 30
+MIN_SPEECH_MS = 250  # 有效语音累计不足这么长就视为误触
+PAD_MS = 200  # 裁剪时两端各留一点余量
+HANGOVER_FRAMES = 5  # 语音帧向两侧扩展，避免把字尾切掉
+ABS_THRESHOLD_DB = -45.0
+FLOOR_MARGIN_DB = 12.0
+OPUS_BITRATE = "24k"  # 16 kHz 人声够用，约 3 KB/s；16 位 WAV 是 32 KB/s
+
+
+@dataclass
+class PreparedAudio:
+    data: bytes
+    mime_type: str
+    has_speech: bool
+    duration: float  # 原始时长（秒）
+    speech_duration: float  # 裁剪后时长（秒）
+    original_bytes: int
+    timings: dict = field(default_factory=dict)  # 各阶段耗时（毫秒）
+
+
+def to_mono_float(samples, channels, sample_width):
+    """交错整型采样 -> [-1, 1] 单声道 float32"""
+    x = np.asarray(samples, dtype=np.float32)
+    if channels > 1: x = x[: len(x) // channels * channels].reshape(-1, channels).mean(axis=1)
+    return x / float(1 << (8 * sample_width - 1))
+
+
+def resample(x, rate, target=TARGET_RATE):
+    if rate == target or len(x) == 0: return x
+    g = gcd(rate, target)
+    return resample_poly(x, target // g, rate // g).astype(np.float32)
+
+
+def speech_mask(x, rate=TARGET_RATE, frame_ms=FRAME_MS):
+    """逐帧 RMS（dBFS），阈值 = max(绝对门限, 噪声底 + 余量)，再做挂起扩展；返回 (扩展后掩码, 帧长, 原始语音帧数)"""
+    frame = int(rate * frame_ms / 1000)
+    n = len(x) // frame
+    if n == 0: return np.zeros(0, dtype=bool), frame, 0
+    frames = x[: n * frame].reshape(n, frame)
+    db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    # 噪声底取最安静的 10% 帧，但不高于绝对门限：从头到尾都在说话的录音没有安静帧，不能把语音本身当噪声
+    floor = min(np.percentile(db, 10), ABS_THRESHOLD_DB)
+    mask = db > max(ABS_THRESHOLD_DB, floor + FLOOR_MARGIN_DB)
+    raw_count = int(mask.sum())
+    if HANGOVER_FRAMES and raw_count:
+        kernel = np.ones(2 * HANGOVER_FRAMES + 1)
+        mask = np.convolve(mask.astype(np.float32), kernel, mode="same") > 0
+    return mask, frame, raw_count
+
+
+def encode_wav(x, rate=TARGET_RATE):
+    buf = io.BytesIO()
+    wavfile.write(buf, rate, (np.clip(x, -1.0, 1.0) * 32767).astype(np.int16))
+    return buf.getvalue()
+
+
+def encode_opus(x, rate=TARGET_RATE):
+    """Ogg/Opus（Gemini 直接收 audio/ogg）；ffmpeg 不可用或不带 libopus 时返回 None，调用方退回 WAV"""
+    from pydub import AudioSegment
+    from pydub.exceptions import CouldntEncodeError
+    pcm = (np.clip(x, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+    buf = io.BytesIO()
+    try:
+        AudioSegment(pcm, sample_width=2, frame_rate=rate, channels=1).export(
+            buf, format="ogg", codec="libopus", bitrate=OPUS_BITRATE, parameters=["-application", "voip"])
+    except (OSError, CouldntEncodeError):
+        return None
+    return buf.getvalue() or None
+
+
+def prepare_samples(samples, rate, channels=1, sample_width=2):
+    timings = {}
+    t0 = time.perf_counter()
+    x = to_mono_float(samples, channels, sample_width)
+    duration = len(x) / rate if rate else 0.0
+    original_bytes = len(x) * channels * sample_width + 44
+    t1 = time.perf_counter(); timings["downmix"] = (t1 - t0) * 1000
+
+    x = resample(x, rate)
+    t2 = time.perf_counter(); timings["resample"] = (t2 - t1) * 1000
+
+    mask, frame, raw_count = speech_mask(x)
+    speech_frames = np.flatnonzero(mask)
+    t3 = time.perf_counter(); timings["vad"] = (t3 - t2) * 1000
+
+    if raw_count * FRAME_MS < MIN_SPEECH_MS:
+        timings["total"] = (t3 - t0) * 1000
+        return PreparedAudio(b"", "audio/wav", False, duration, 0.0, original_bytes, timings)
+
+    pad = int(TARGET_RATE * PAD_MS / 1000)
+    start = max(0, speech_frames[0] * frame - pad)
+    end = min(len(x), (speech_frames[-1] + 1) * frame + pad)
+    x = x[start:end]
+    t4 = time.perf_counter(); timings["trim"] = (t4 - t3) * 1000
+
+    data, mime_type = encode_opus(x), "audio/ogg"
+    if data is None: data, mime_type = encode_wav(x), "audio/wav"
+    t5 = time.perf_counter(); timings["encode"] = (t5 - t4) * 1000
+    timings["total"] = (t5 - t0) * 1000
+    return PreparedAudio(data, mime_type, True, duration, len(x) / TARGET_RATE, original_bytes, timings)
+
+
+def prepare_guess_audio(segment):
+    """pydub.AudioSegment（audiorecorder 的返回值）-> PreparedAudio"""
+    return prepare_samples(segment.get_array_of_samples(), segment.frame_rate, segment.channels, segment.sample_width)